@@ -1,9 +1,10 @@
 #!/bin/bash
 
 PORT=5000
-SCRIPT="/home/administrator/biometric/zkteco_http_listener.py "
+BENCH="/home/administrator/frappe-bench"
+CONFIG="/home/administrator/biometric/listener.json"
 LOGFILE="/home/administrator/biometric/listener.log"
-PYTHON="/usr/bin/python3"
+PYTHON="$BENCH/env/bin/python"
 
 echo "=======================" >> $LOGFILE
 echo "Run started at $(date)" >> $LOGFILE
@@ -11,20 +12,30 @@ echo "Run started at $(date)" >> $LOGFILE
 PID=$(lsof -ti:$PORT)
 
 if [ -n "$PID" ]; then
-    echo "Port $PORT occupied by PID $PID - terminating ....." >> $LOGFILE
-    kill -9 $PID
-    sleep 2
+    ## SIGTERM lets the listener finish in-flight requests, queued punches stay on disk for the next start
+    echo "Port $PORT occupied by PID $PID - stopping gracefully ....." >> $LOGFILE
+    kill -TERM $PID
+    for i in $(seq 1 30); do
+        kill -0 $PID 2>/dev/null || break
+        sleep 1
+    done
+    if kill -0 $PID 2>/dev/null; then
+        echo "PID $PID did not stop after 30s - terminating ....." >> $LOGFILE
+        kill -9 $PID
+        sleep 2
+    fi
 else
     echo "Port $PORT already free." >> $LOGFILE
 fi
 
 
-# RUN SCRIPT
+# RUN LISTENER
 echo "Executing biometric listener ...." >> $LOGFILE
 
-$PYTHON $SCRIPT >> $LOGFILE 2>&1
+cd $BENCH/sites
+$PYTHON -m neviraflow.biometric_listener --config $CONFIG >> $LOGFILE 2>&1
 
 EXIT_CODE=$?
 
-echo "Script Finished with exit code $EXIT_CODE" >> $LOGFILE
-echo "Run ended at $(date)" >> $LOGFILE
\ No newline at end of file
+echo "Listener Finished with exit code $EXIT_CODE" >> $LOGFILE
+echo "Run ended at $(date)" >> $LOGFILE
@@ -3,6 +3,8 @@ from frappe.utils import now_datetime, getdate, get_time, add_to_date
 from datetime import datetime, time, timedelta
 from frappe import _
 
+from neviraflow.shift_assignment_index import get_shift_at, get_employees_with_shift_assignments
+
 
 @frappe.whitelist(allow_guest=True)
 def mark_absentees():
@@ -35,7 +37,7 @@ def mark_absentees():
         for employee_id in employees_to_mark_absent:
             try:
                 ## Check if the employee is on leave
-                shift_type = get_employee_shift(employee_id)
+                shift_type = get_employee_shift(employee_id, previous_day)
                 ## Check if the employee is on leave, the HR module auto-creates approved leaves on attendance list, so no need to create them ourselves
                 on_leave = check_employee_on_leave(employee_id, previous_day)
                 status = "On Leave" if on_leave else "Absent"
@@ -68,15 +70,6 @@ def get_active_employees():
     active_employees = frappe.get_all("Employee",filters={"status":"Active"}, fields=["name"])
     return [emp.name for emp in active_employees]
 
-def get_employees_with_shift_assignments():
-    """
-    Get the employees with shift assignments
-    """
-    assignments = frappe.get_all("Shift Assignment",
-                                 filters = {"status": "Active"},fields=["employee","shift_type"], distinct=True)
-    
-    return [assignment.employee for assignment in assignments]
-
 def get_employee_with_attendance(date):
     """
     Get employees who already have an attendance on the previous day
@@ -89,19 +82,11 @@ def get_employee_with_attendance(date):
 
     return [att.employee for att in attendances]
 
-def get_employee_shift(employee):
+def get_employee_shift(employee, date=None):
     """
     Get the shift type for an employee, just one shift only
     """
-    shift_assignment = frappe.get_all("Shift Assignment",
-                            filters={
-                                "employee": employee,
-                                "status": "Active"
-                            },
-                            fields = ["shift_type"],
-                            limit =1
-                            )
-    return shift_assignment[0].shift_type if shift_assignment else None
+    return get_shift_at(employee, date or getdate())
 
 
 def check_employee_on_leave(employee, date):
@@ -0,0 +1,232 @@
+import frappe
+from frappe import _
+from frappe.utils import getdate, add_days, date_diff
+
+from neviraflow.shift_assignment_index import get_shift_at, get_employees_with_shift_assignments
+
+
+BACKFILL_CHUNK_SIZE = 500
+BACKFILL_MAX_DAYS = 366
+BACKFILL_PROGRESS_EVENT = "absentee_backfill_progress"
+
+
+@frappe.whitelist()
+def backfill_absentees(from_date, to_date, dry_run=0):
+    """
+    Mark absentees for every day between from_date and to_date (inclusive).
+    This runs the same rules as mark_absentees but over a date range, it is meant for
+    days the scheduled job did not run e.g when the job is disabled or the server was down.
+    The absent rows are inserted in chunked background jobs and progress is published
+    through the absentee_backfill_progress realtime event.
+    """
+    frappe.only_for(("HR Manager", "System Manager"))
+
+    from_date, to_date = getdate(from_date), getdate(to_date)
+    if from_date > to_date:
+        frappe.throw(_("From Date cannot be after To Date"))
+
+    if date_diff(to_date, from_date) + 1 > BACKFILL_MAX_DAYS:
+        frappe.throw(_("Backfill range cannot exceed {0} days").format(BACKFILL_MAX_DAYS))
+
+    if getdate(to_date) >= getdate():
+        frappe.throw(_("Backfill can only run for days that have already ended"))
+
+    rows = compute_missing_absentees(from_date, to_date)
+
+    if frappe.utils.cint(dry_run):
+        return {"total": len(rows), "rows": rows}
+
+    chunks = [rows[i:i + BACKFILL_CHUNK_SIZE] for i in range(0, len(rows), BACKFILL_CHUNK_SIZE)]
+    for idx, chunk in enumerate(chunks, start=1):
+        frappe.enqueue(
+            "neviraflow.attendance_backfill.insert_absentee_chunk",
+            queue="long",
+            timeout=1500,
+            rows=chunk,
+            chunk_no=idx,
+            total_chunks=len(chunks),
+            user=frappe.session.user,
+            enqueue_after_commit=True,
+        )
+
+    frappe.msgprint(_("Queued {0} absent records in {1} background jobs").format(len(rows), len(chunks)))
+    return {"total": len(rows), "chunks": len(chunks)}
+
+
+def compute_missing_absentees(from_date, to_date):
+    """
+    Build the employee x day matrix for the range in memory and return the Attendance rows
+    that are missing. Leaves, holidays and existing attendance are loaded once for the whole
+    range and shifts come from the shift assignment index instead of a query per employee and day.
+    """
+    days = [add_days(from_date, i) for i in range(date_diff(to_date, from_date) + 1)]
+
+    employees_with_assignments = get_employees_with_shift_assignments()
+    if not employees_with_assignments:
+        return []
+
+    employees = get_employee_details(employees_with_assignments)
+    holidays = get_holidays_in_range(employees, from_date, to_date)
+    leaves = get_leave_days_in_range(list(employees), from_date, to_date)
+    existing = get_existing_attendance(from_date, to_date)
+
+    rows = []
+    for employee_id, emp in employees.items():
+        joining_date = getdate(emp.date_of_joining) if emp.date_of_joining else None
+        relieving_date = getdate(emp.relieving_date) if emp.relieving_date else None
+        employee_holidays = holidays.get(emp.holiday_list, set())
+
+        for day in days:
+            day = getdate(day)
+            if joining_date and day < joining_date:
+                continue
+            if relieving_date and day > relieving_date:
+                continue
+            if (employee_id, day) in existing:
+                continue
+            ## Approved leaves are marked on the Attendance list by the HR module, so we leave them alone
+            if (employee_id, day) in leaves:
+                continue
+            if day in employee_holidays:
+                continue
+
+            shift_type = get_shift_at(employee_id, day)
+            if not shift_type:
+                continue
+
+            rows.append({
+                "employee": employee_id,
+                "attendance_date": str(day),
+                "shift": shift_type
+            })
+    return rows
+
+
+def insert_absentee_chunk(rows, chunk_no=1, total_chunks=1, user=None):
+    """
+    Background job that inserts one chunk of absent Attendance rows.
+    Existing attendance is checked again for the chunk in one query since a checkin
+    might have created a record between queueing and running the job.
+    """
+    if not rows:
+        return
+
+    employees = list({row["employee"] for row in rows})
+    dates = [getdate(row["attendance_date"]) for row in rows]
+    existing = get_existing_attendance(min(dates), max(dates), employees=employees)
+
+    created, skipped, failed = 0, 0, 0
+    for row in rows:
+        if (row["employee"], getdate(row["attendance_date"])) in existing:
+            skipped += 1
+            continue
+        try:
+            attendance = frappe.new_doc("Attendance")
+            attendance.update({
+                "employee": row["employee"],
+                "status": "Absent",
+                "attendance_date": row["attendance_date"],
+                "shift": row["shift"]
+            })
+            attendance.insert(ignore_permissions=True, ignore_if_duplicate=True)
+            attendance.submit()
+            created += 1
+        except Exception:
+            failed += 1
+            frappe.log_error(frappe.get_traceback(), f"Absentee backfill failed for employee {row['employee']}")
+            frappe.db.rollback()
+            continue
+        frappe.db.commit()
+
+    frappe.publish_realtime(
+        BACKFILL_PROGRESS_EVENT,
+        {
+            "chunk_no": chunk_no,
+            "total_chunks": total_chunks,
+            "progress": round(chunk_no / total_chunks * 100, 2) if total_chunks else 100,
+            "created": created,
+            "skipped": skipped,
+            "failed": failed
+        },
+        user=user,
+    )
+
+
+def get_employee_details(employee_ids):
+    """
+    Get the active employees with the holiday list that applies to each of them
+    """
+    if not employee_ids:
+        return {}
+
+    employees = frappe.get_all("Employee",
+                               filters={"name": ["in", employee_ids], "status": "Active"},
+                               fields=["name", "company", "holiday_list", "date_of_joining", "relieving_date"])
+
+    company_holiday_lists = {}
+    for emp in employees:
+        if not emp.holiday_list:
+            if emp.company not in company_holiday_lists:
+                company_holiday_lists[emp.company] = frappe.get_cached_value("Company", emp.company, "default_holiday_list")
+            emp.holiday_list = company_holiday_lists[emp.company]
+
+    return {emp.name: emp for emp in employees}
+
+
+def get_holidays_in_range(employees, from_date, to_date):
+    """
+    Get the holidays per holiday list within the range as sets of dates
+    """
+    holiday_lists = list({emp.holiday_list for emp in employees.values() if emp.holiday_list})
+    if not holiday_lists:
+        return {}
+
+    holidays = frappe.get_all("Holiday",
+                              filters={"parent": ["in", holiday_lists],
+                                       "holiday_date": ["between", [from_date, to_date]]},
+                              fields=["parent", "holiday_date"])
+
+    by_list = {}
+    for row in holidays:
+        by_list.setdefault(row.parent, set()).add(getdate(row.holiday_date))
+    return by_list
+
+
+def get_leave_days_in_range(employee_ids, from_date, to_date):
+    """
+    Get every (employee, date) pair covered by an approved leave application in the range
+    """
+    if not employee_ids:
+        return set()
+
+    leave_applications = frappe.get_all("Leave Application",
+                                        filters={
+                                            "employee": ["in", employee_ids],
+                                            "from_date": ["<=", to_date],
+                                            "to_date": [">=", from_date],
+                                            "status": "Approved"
+                                        },
+                                        fields=["employee", "from_date", "to_date"])
+
+    leave_days = set()
+    for leave in leave_applications:
+        start = max(getdate(leave.from_date), getdate(from_date))
+        end = min(getdate(leave.to_date), getdate(to_date))
+        for i in range(date_diff(end, start) + 1):
+            leave_days.add((leave.employee, getdate(add_days(start, i))))
+    return leave_days
+
+
+def get_existing_attendance(from_date, to_date, employees=None):
+    """
+    Get every (employee, date) pair that already has a non-cancelled attendance in the range
+    """
+    filters = {
+        "attendance_date": ["between", [from_date, to_date]],
+        "docstatus": ["!=", 2]
+    }
+    if employees:
+        filters["employee"] = ["in", employees]
+
+    attendances = frappe.get_all("Attendance", filters=filters, fields=["employee", "attendance_date"])
+    return {(att.employee, getdate(att.attendance_date)) for att in attendances}
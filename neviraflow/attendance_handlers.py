@@ -1,15 +1,11 @@
-from datetime import datetime, date, time, timedelta
+from datetime import datetime, date
 import frappe
-from frappe.utils import get_datetime, add_days, date_diff, time_diff_in_hours, getdate
+from frappe.utils import get_datetime, date_diff, time_diff_in_hours, getdate
 
+from neviraflow.shift_assignment_index import get_shift_at
+from neviraflow.shift_windows import get_attendance_date
+from neviraflow.punch_dedup import remember_punch
 
-# Shift clock rules (24h)
-SHIFT_CONFIG = {
-    "General Shift": (time(8, 0),  time(17, 0)),  # in-window for logs is 08:00–23:00 but attendance end is 17:00
-    "SHIFT A":       (time(6, 0),  time(15, 0)),
-    "SHIFT B":       (time(14, 0), time(23, 0)),
-    "SHIFT C":       (time(23, 0), time(9, 0)),   # crosses midnight
-}
 
 def after_insert_action(doc, method = None):
     """
@@ -21,7 +17,15 @@ def after_insert_action(doc, method = None):
     employee_name = doc.employee_name
     log_in_type = doc.log_type
     ts = get_datetime(doc.time)
-    shift_code = doc.shift or None
+
+    remember_punch(employee_id, ts)
+
+    ### Punches marked as duplicates of the previous punch (double taps, device resends) do not touch attendance
+    if doc.flags.duplicate_punch:
+        return
+
+    ### Only a shift that is actually assigned is stored on the attendance, the General Shift fallback may not exist
+    shift_code = doc.shift or get_assigned_shift(employee_id, ts)
 
     ### Fetch or create attendance per log type
     try:
@@ -77,23 +81,24 @@ def compute_shift_window(doc, method=None):
         attendance_in_time : in_time (datetime)
         attendance_out_time : out_time (datetime)
     """
-    
-    in_time, out_time, attendance_date = None, None, None
     ts = get_datetime(doc.time)
+    shift_code = doc.shift or get_shift_for_employee(doc.employee, ts)
+    return resolve_attendance_window(ts, doc.log_type, shift_code)
 
-    if doc.log_type == "IN":
-        attendance_date = ts.date()
-        in_time = datetime.combine(ts.date(), ts.time())
-        return in_time, attendance_date
-        
-    if doc.log_type == "OUT":
-        if (ts.time() > time(0,0)) and (ts.time() < time(10,0)): 
-            out_time = datetime.combine(ts.date(), ts.time()) ## Keep the out time as it is
-            attendance_date = ts.date() - timedelta(days=1) ## This means that check-out after midnight refer to the previous day's attendance
-        else:
-            out_time = ts
-            attendance_date = ts.date() ## Just the date as it is without adding a day
-        return out_time, attendance_date
+
+def resolve_attendance_window(ts, log_type, shift_code=None):
+    """
+    Resolve the attendance time and attendance date for a punch.
+    The attendance date comes from the precomputed window of the punch's Shift Type, so
+    e.g SHIFT C OUT punches after midnight belong to the previous day's attendance.
+    Shared by the checkin hooks and the attendance rebuild so both apply the same rules.
+    """
+    if log_type not in ("IN", "OUT"):
+        return None, None
+
+    event_time = datetime.combine(ts.date(), ts.time())
+    attendance_date = get_attendance_date(ts, log_type, shift_code)
+    return event_time, attendance_date
 
 
 def get_attendance(employee: str, attendance_date: date):
@@ -149,46 +154,62 @@ def evaluate_and_infer_logtype(doc, method=None):
     employee = doc.employee
     previous_log_type, previous_log_time = get_previous_logtype_and_time(employee)
 
+    ### A duplicate punch repeats the previous log type so it cannot flip the IN/OUT sequence
+    if doc.flags.duplicate_punch:
+        doc.log_type = previous_log_type or doc.log_type
+        return
+
     if not doc.device_id:
-        if not previous_log_time or not previous_log_type:
-            doc.log_type = "IN"
+        doc.log_type = infer_logtype(previous_log_type, previous_log_time, doc.time) or doc.log_type
 
-        current_date = getdate(doc.time)
-        last_checkin_date = getdate(previous_log_time)
+        print(f" Log type set is: {doc.log_type}")
+        frappe.logger().info(f"Inferred log type: {doc.log_type}")
 
-        time_difference_hours = time_diff_in_hours(doc.time, previous_log_time)
-        days_difference = date_diff(current_date, last_checkin_date)
 
+def infer_logtype(previous_log_type, previous_log_time, current_time):
+    """
+    Infer the log type of a punch from the employee's previous punch.
+    Returns None when none of the rules apply so the caller keeps the punch's own log type
+    """
+    if not previous_log_time or not previous_log_type:
+        return "IN"
 
-        if previous_log_type == "IN":
-            if current_date == last_checkin_date:
-               doc.log_type = "OUT"
+    current_date = getdate(current_time)
+    last_checkin_date = getdate(previous_log_time)
 
-            elif (days_difference == 1) and (time_difference_hours <= 16): ## Best case is that in Shift C, someone has until 8am to checkout
-                doc.log_type = "OUT"
+    time_difference_hours = time_diff_in_hours(current_time, previous_log_time)
+    days_difference = date_diff(current_date, last_checkin_date)
 
 
-            elif (days_difference == 1) and (time_difference_hours >= 16): ### Some one forgot to checkout the previous day hence above 16hrs, so this considered as a new checkin
-                doc.log_type = "IN"
+    if previous_log_type == "IN":
+        if current_date == last_checkin_date:
+            return "OUT"
 
-            elif days_difference > 1:
-                doc.log_type = "IN"
+        elif (days_difference == 1) and (time_difference_hours <= 16): ## Best case is that in Shift C, someone has until 8am to checkout
+            return "OUT"
 
-        elif previous_log_type == "OUT":
-            if (days_difference == 1) and (time_difference_hours <= 18):
-                doc.log_type = "IN"
 
-            elif (current_date == last_checkin_date): #and (time_difference_hours >= 10)
-                doc.log_type = "IN"
+        elif (days_difference == 1) and (time_difference_hours >= 16): ### Some one forgot to checkout the previous day hence above 16hrs, so this considered as a new checkin
+            return "IN"
 
-            elif days_difference > 1:
-                doc.log_type = "IN"
+        elif days_difference > 1:
+            return "IN"
 
-        else:
-           doc.log_type = "IN"
+    elif previous_log_type == "OUT":
+        if (days_difference == 1) and (time_difference_hours <= 18):
+            return "IN"
+
+        elif (current_date == last_checkin_date): #and (time_difference_hours >= 10)
+            return "IN"
+
+        elif days_difference > 1:
+            return "IN"
+
+    else:
+        return "IN"
+
+    return None
 
-        print(f" Log type set is: {doc.log_type}")
-        frappe.logger().info(f"Inferred log type: {doc.log_type}")
 
 def get_previous_logtype_and_time(employee_id):
     """
@@ -212,21 +233,11 @@ def get_shift_for_employee(employee: str, when_dt: datetime) -> str | None:
     Find the most recent shift that the employee has been assigned to, if no
     shift is found then use the General Shift
     """
+    return get_shift_at(employee, when_dt, default="General Shift")
 
-    the_day = when_dt.date()
-    row = frappe.db.sql(""" 
-            SELECT sa.shift_type 
-            FROM `tabShift Assignment` AS sa JOIN (
-                    SELECT employee, MAX(creation) AS maxc 
-                    FROM `tabShift Assignment` WHERE status = 'Active' GROUP BY employee)
-                    x ON x.employee = sa.employee 
-            AND x.maxc = sa.creation
-            WHERE sa.employee=%s
-            AND (sa.start_date IS NULL OR sa.start_date <= %s)
-            AND (sa.end_date IS NULL OR sa.end_date >= %s)
-            LIMIT 1
-            """, (employee, the_day, the_day), as_dict=True)
-    if row:
-        return row[0]["shift_type"]
-    else:
-        return "General Shift"
+
+def get_assigned_shift(employee: str, when_dt: datetime) -> str | None:
+    """
+    The shift of the employee's Shift Assignment at the time, else the Employee's default shift, else None
+    """
+    return get_shift_at(employee, when_dt) or frappe.get_cached_value("Employee", employee, "default_shift")
@@ -0,0 +1,133 @@
+from datetime import datetime, time, timedelta
+
+import frappe
+from frappe import _
+from frappe.utils import getdate, get_datetime, add_days, date_diff, flt, cint
+
+from neviraflow.payroll_attendance_matrix import invalidate_period_matrix
+from neviraflow.shift_assignment_index import get_shift_at
+from neviraflow.shift_windows import get_shift_window
+
+
+METRIC_FIELDS = ("working_hours", "late_entry", "early_exit",
+                 "custom_late_minutes", "custom_early_exit_minutes", "custom_overtime_hours")
+METRICS_SYNC_MAX_DAYS = 62
+
+
+@frappe.whitelist()
+def compute_attendance_metrics(from_date, to_date, employee=None):
+    """
+    Compute worked hours, lateness, early exits and overtime for the submitted Attendance in the period.
+    Ranges longer than two months are run in the background.
+    """
+    frappe.only_for(("HR Manager", "HR User", "System Manager"))
+
+    if getdate(from_date) > getdate(to_date):
+        frappe.throw(_("From Date cannot be after To Date"))
+
+    if date_diff(to_date, from_date) + 1 > METRICS_SYNC_MAX_DAYS:
+        frappe.enqueue("neviraflow.attendance_metrics.update_attendance_metrics", queue="long", timeout=3600,
+                       from_date=from_date, to_date=to_date, employee=employee)
+        frappe.msgprint(_("Attendance metrics computation has been queued"))
+        return
+
+    updated = update_attendance_metrics(from_date, to_date, employee)
+    frappe.msgprint(_("Attendance metrics updated for {0} records").format(updated))
+    return updated
+
+
+def compute_previous_day_metrics():
+    """
+    Daily job: compute the metrics for yesterday's attendance
+    """
+    yesterday = add_days(getdate(), -1)
+    update_attendance_metrics(yesterday, yesterday)
+
+
+def update_attendance_metrics(from_date, to_date, employee=None):
+    """
+    Load the period's attendance in one query, compute the metrics for every row in a single pass
+    against the precomputed shift windows and write back only the rows that changed in bulk.
+    """
+    filters = {
+        "docstatus": 1,
+        "attendance_date": ["between", [getdate(from_date), getdate(to_date)]]
+    }
+    if employee:
+        filters["employee"] = employee
+
+    attendances = frappe.get_all("Attendance",
+                                 filters=filters,
+                                 fields=["name", "employee", "attendance_date", "shift", "in_time", "out_time",
+                                         *METRIC_FIELDS])
+
+    updates = {}
+    for att in attendances:
+        shift_type = att.shift or get_shift_at(att.employee, att.attendance_date)
+        metrics = compute_metrics(getdate(att.attendance_date), att.in_time, att.out_time, get_shift_window(shift_type))
+
+        changed = {field: value for field, value in metrics.items() if flt(att.get(field)) != flt(value)}
+        if changed:
+            updates[att.name] = changed
+
+    if updates:
+        frappe.db.bulk_update("Attendance", updates, chunk_size=500, update_modified=False)
+        frappe.db.commit()
+        ## The payroll matrix sums the overtime hours the salary slips pay
+        invalidate_period_matrix(from_date, to_date)
+    return len(updates)
+
+
+def compute_metrics(attendance_date, in_time, out_time, window=None):
+    """
+    Compute the metrics of one attendance against its shift window.
+    Without a shift window only the worked hours can be computed.
+    """
+    in_time = get_datetime(in_time) if in_time else None
+    out_time = get_datetime(out_time) if out_time else None
+
+    metrics = {
+        "working_hours": 0,
+        "late_entry": 0,
+        "early_exit": 0,
+        "custom_late_minutes": 0,
+        "custom_early_exit_minutes": 0,
+        "custom_overtime_hours": 0
+    }
+
+    if in_time and out_time and out_time > in_time:
+        metrics["working_hours"] = round((out_time - in_time).total_seconds() / 3600, 2)
+
+    if not window:
+        return metrics
+
+    day_start = datetime.combine(attendance_date, time())
+    shift_start = day_start + timedelta(minutes=window.start)
+    shift_end = day_start + timedelta(minutes=window.end, days=1 if window.crosses_midnight else 0)
+
+    if in_time:
+        late_minutes = max(0, int((in_time - shift_start).total_seconds() // 60))
+        metrics["custom_late_minutes"] = late_minutes
+        metrics["late_entry"] = cint(late_minutes > window.late_grace)
+
+    if out_time and out_time > (in_time or shift_start):
+        early_minutes = max(0, int((shift_end - out_time).total_seconds() // 60))
+        metrics["custom_early_exit_minutes"] = early_minutes
+        metrics["early_exit"] = cint(early_minutes > window.early_grace)
+        metrics["custom_overtime_hours"] = round(max(0, (out_time - shift_end).total_seconds()) / 3600, 2)
+
+    return metrics
+
+
+def get_attendance_status(in_time, out_time, working_hours, window=None) -> str:
+    """
+    The status punches give an attendance: the shift's working hours thresholds decide between
+    Absent, Half Day and Present once both the IN and OUT are known, a lone punch counts as Present
+    """
+    if not in_time or not out_time or not window:
+        return "Present"
+    if window.absent_hours and flt(working_hours) < window.absent_hours:
+        return "Absent"
+    if window.half_day_hours and flt(working_hours) < window.half_day_hours:
+        return "Half Day"
+    return "Present"
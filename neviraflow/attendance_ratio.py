@@ -0,0 +1,114 @@
+import frappe
+from frappe import _
+from frappe.utils import getdate, date_diff
+
+from neviraflow.payroll_attendance_matrix import get_attendance_matrix, get_employee_attendance
+from neviraflow.payroll_batch import get_payroll_employee
+
+
+RATIO_CACHE_KEY = "neviraflow_attendance_ratio"
+RATIO_CACHE_TTL = 7 * 24 * 60 * 60
+MIN_ATTENDANCE_RATIO = 75
+
+
+def get_attendance_ratio(employee, start_date, end_date) -> dict:
+    """
+    Get the employee's marked attendance ratio for the period with its inputs (marked days and adjusted days).
+    Cached per period in a hash per employee until Attendance of the employee in the period changes,
+    so repeated Salary Slip saves do no counting.
+    """
+    start_date, end_date = getdate(start_date), getdate(end_date)
+    key = get_ratio_key(employee)
+    field = get_ratio_field(start_date, end_date)
+
+    ratio = frappe.cache().hget(key, field)
+    if ratio is None:
+        employee_details = get_payroll_employee(employee, start_date, end_date)
+        marked_days = get_employee_attendance(employee, start_date, end_date)["marked_days"]
+        ratio = compute_attendance_ratio(marked_days, employee_details.date_of_joining, start_date, end_date)
+        frappe.cache().hset(key, field, ratio)
+        frappe.cache().expire(frappe.cache().make_key(key), RATIO_CACHE_TTL)
+    return frappe._dict(ratio)
+
+
+def compute_attendance_ratio(marked_days, date_of_joining, start_date, end_date) -> dict:
+    """
+    Employees who joined before the period are allowed 6 unmarked days, new joiners 3
+    """
+    joining_date = getdate(date_of_joining) if date_of_joining else start_date
+
+    if joining_date <= start_date:
+        adjusted_days = date_diff(end_date, start_date) + 1 - 6
+    else:
+        adjusted_days = date_diff(end_date, joining_date) + 1 - 3
+
+    ratio = round((marked_days / adjusted_days) * 100, 2) if adjusted_days > 0 else 0
+    return {"ratio": ratio, "marked_days": marked_days, "adjusted_days": adjusted_days}
+
+
+@frappe.whitelist()
+def get_low_attendance_employees(payroll_entry):
+    """
+    List every employee of a Payroll Entry whose attendance ratio is below the minimum
+    """
+    frappe.get_doc("Payroll Entry", payroll_entry).check_permission("read")
+    return find_low_attendance_employees(payroll_entry)
+
+
+def find_low_attendance_employees(payroll_entry):
+    """
+    List every employee of a Payroll Entry whose attendance ratio is below the minimum,
+    from the period matrix and the cached ratios, without a permission check for internal callers
+    """
+    entry = frappe.get_doc("Payroll Entry", payroll_entry)
+    employees = [row.employee for row in entry.get("employees") or [] if row.employee]
+    get_attendance_matrix(entry.start_date, entry.end_date)
+
+    low = []
+    for employee in employees:
+        ratio = get_attendance_ratio(employee, entry.start_date, entry.end_date)
+        if ratio.ratio < MIN_ATTENDANCE_RATIO:
+            low.append({"employee": employee, **ratio})
+    return low
+
+
+def invalidate_attendance_ratio(doc, method=None):
+    """
+    Attendance on_submit/on_cancel hook: drop the employee's cached ratios of the periods covering the attendance date
+    """
+    clear_ratio_cache(doc.employee, getdate(doc.attendance_date))
+
+
+def clear_employee_attendance_ratio(doc, method=None):
+    """
+    Employee on_update hook: the joining date feeds the adjusted days
+    """
+    clear_ratio_cache(doc.name)
+
+
+def clear_ratio_cache(employee, attendance_date=None):
+    """
+    Drop the cached ratios of an employee, optionally only the periods covering a date
+    """
+    key = get_ratio_key(employee)
+    if not attendance_date:
+        frappe.cache().delete_value(key)
+        return
+
+    for field in frappe.cache().hkeys(key) or []:
+        field = frappe.safe_decode(field)
+        start, end = field.split("::")
+        if getdate(start) <= attendance_date <= getdate(end):
+            frappe.cache().hdel(key, field)
+
+
+def get_ratio_key(employee) -> str:
+    return f"{RATIO_CACHE_KEY}::{employee}"
+
+
+def get_ratio_field(start_date, end_date) -> str:
+    return f"{start_date}::{end_date}"
+
+
+def format_low_attendance(rows) -> str:
+    return ", ".join(_("{0} ({1}%)").format(row["employee"], row["ratio"]) for row in rows)
@@ -0,0 +1,363 @@
+import frappe
+from frappe import _
+from frappe.utils import getdate, get_datetime, add_days, cint, flt
+
+from neviraflow.attendance_handlers import (
+    infer_logtype, resolve_attendance_window, make_attendance, get_shift_for_employee, get_assigned_shift
+)
+from neviraflow.attendance_metrics import METRIC_FIELDS, compute_metrics, get_attendance_status
+from neviraflow.payroll_attendance_matrix import invalidate_period_matrix
+from neviraflow.shift_assignment_index import get_shift_at
+from neviraflow.shift_windows import get_shift_window
+
+
+REBUILD_PAGE_SIZE = 5000
+REBUILD_FLUSH_EMPLOYEES = 200
+REBUILD_APPLY_BATCH_SIZE = 500
+REBUILD_REPORT_SAMPLE_SIZE = 200
+REBUILD_REPORT_EVENT = "attendance_rebuild_report"
+
+
+@frappe.whitelist()
+def rebuild_attendance(from_date, to_date, employee=None, dry_run=1):
+    """
+    Queue a rebuild of Attendance in/out times from the Employee Checkins in the range.
+    The report (and the applied changes when dry_run is off) is published through the
+    attendance_rebuild_report realtime event once the job finishes.
+    """
+    frappe.only_for(("HR Manager", "System Manager"))
+
+    if getdate(from_date) > getdate(to_date):
+        frappe.throw(_("From Date cannot be after To Date"))
+
+    frappe.enqueue(
+        "neviraflow.attendance_rebuild.run_attendance_rebuild",
+        queue="long",
+        timeout=7200,
+        from_date=from_date,
+        to_date=to_date,
+        employee=employee,
+        dry_run=cint(dry_run),
+        user=frappe.session.user,
+    )
+    frappe.msgprint(_("Attendance rebuild has been queued, the report will be shown once it completes"))
+
+
+def run_attendance_rebuild(from_date, to_date, employee=None, dry_run=1, user=None):
+    """
+    Replay the checkins of the range in (employee, time) order with the same rules as the
+    checkin hooks, diff the result against the existing Attendance and apply only the changes.
+    Checkins are streamed page by page and attendance is diffed for a batch of employees at a time
+    so memory stays bounded no matter how long the range is.
+    """
+    from_date, to_date = getdate(from_date), getdate(to_date)
+    dry_run = cint(dry_run)
+
+    report = frappe._dict({
+        "from_date": str(from_date),
+        "to_date": str(to_date),
+        "dry_run": dry_run,
+        "checkins_scanned": 0,
+        "log_type_changes": 0,
+        "attendance_updated": 0,
+        "attendance_created": 0,
+        "samples": []
+    })
+
+    pending_states = {}
+    pending_log_types = []
+
+    for emp, log_type_changes, states, scanned in replay_checkins(from_date, to_date, employee):
+        report.checkins_scanned += scanned
+        pending_log_types.extend(log_type_changes)
+        pending_states[emp] = states
+
+        if len(pending_states) >= REBUILD_FLUSH_EMPLOYEES or len(pending_log_types) >= REBUILD_APPLY_BATCH_SIZE:
+            flush_rebuild_changes(pending_states, pending_log_types, from_date, to_date, report)
+            pending_states, pending_log_types = {}, []
+
+    flush_rebuild_changes(pending_states, pending_log_types, from_date, to_date, report)
+
+    if user:
+        frappe.publish_realtime(REBUILD_REPORT_EVENT, report, user=user)
+    return report
+
+
+def replay_checkins(from_date, to_date, employee=None):
+    """
+    Replay the checkins employee by employee.
+    Yields (employee, log type changes, attendance states, checkins scanned) once per employee.
+    The last punch before the range seeds the log type inference of the first punch in the range.
+    """
+    previous_punches = get_last_punch_before(from_date, employee)
+    range_end = get_datetime(add_days(to_date, 1))
+
+    current_employee = None
+    prev_type, prev_time = None, None
+    log_type_changes, states, scanned = [], {}, 0
+
+    for row in iter_checkins(from_date, add_days(to_date, 2), employee):
+        if row.employee != current_employee:
+            if current_employee:
+                yield current_employee, log_type_changes, states, scanned
+            current_employee = row.employee
+            prev_type, prev_time = previous_punches.get(row.employee, (None, None))
+            log_type_changes, states, scanned = [], {}, 0
+
+        ts = get_datetime(row.time)
+
+        ## Punches marked as duplicates (or excluded from auto attendance) are left as they are
+        if row.skip_auto_attendance:
+            continue
+
+        log_type = row.log_type
+        if not row.device_id:
+            log_type = infer_logtype(prev_type, prev_time, ts) or row.log_type
+
+        ## Punches of the day after the range are only replayed so overnight OUTs land on the last day
+        if ts < range_end:
+            scanned += 1
+            if log_type != row.log_type:
+                log_type_changes.append((row.name, log_type))
+
+        apply_punch(states, log_type, ts, row.shift or get_shift_for_employee(row.employee, ts),
+                    row.shift or get_assigned_shift(row.employee, ts))
+        prev_type, prev_time = log_type, ts
+
+    if current_employee:
+        yield current_employee, log_type_changes, states, scanned
+
+
+def apply_punch(states, log_type, ts, shift_code=None, assigned_shift=None):
+    """
+    Apply a punch to the in-memory attendance states the same way after_insert_action
+    creates and updates Attendance. shift_code resolves the attendance window,
+    assigned_shift is what gets stored on new Attendance
+    """
+    if log_type not in ("IN", "OUT"):
+        return
+
+    event_time, attendance_date = resolve_attendance_window(ts, log_type, shift_code)
+    state = states.get(attendance_date)
+
+    if log_type == "IN":
+        if not state:
+            states[attendance_date] = {"in_time": event_time, "out_time": None, "shift": assigned_shift}
+        elif not state["in_time"]:
+            state["in_time"] = event_time
+
+    elif log_type == "OUT":
+        if state:
+            if not state["out_time"] or event_time > state["out_time"]:
+                state["out_time"] = event_time
+        else:
+            states[attendance_date] = {"in_time": event_time, "out_time": None, "shift": assigned_shift}
+
+
+def flush_rebuild_changes(pending_states, pending_log_types, from_date, to_date, report):
+    """
+    Diff the replayed attendance states against the existing Attendance of the employees
+    in one query, record the changes on the report and apply them unless it's a dry run
+    """
+    if pending_log_types:
+        report.log_type_changes += len(pending_log_types)
+        for name, log_type in pending_log_types:
+            add_sample(report, {"checkin": name, "log_type": log_type})
+        if not report.dry_run:
+            update_checkin_log_types(pending_log_types)
+
+    if not pending_states:
+        return
+
+    existing = get_existing_attendance(list(pending_states), from_date, to_date)
+    updates, creates = [], []
+
+    for emp, states in pending_states.items():
+        for attendance_date, state in states.items():
+            if attendance_date < from_date or attendance_date > to_date:
+                continue
+
+            att = existing.get((emp, attendance_date))
+            if not att:
+                creates.append((emp, attendance_date, state))
+                add_sample(report, {"employee": emp, "attendance_date": str(attendance_date), "action": "create",
+                                    "in_time": str(state["in_time"]), "out_time": str(state["out_time"] or "")})
+                continue
+
+            changes = {}
+            if not same_time(att.in_time, state["in_time"]):
+                changes["in_time"] = state["in_time"]
+            if not same_time(att.out_time, state["out_time"]):
+                changes["out_time"] = state["out_time"]
+            if changes:
+                changes.update(get_derived_changes(att, state))
+                updates.append((att.name, changes))
+                add_sample(report, {"attendance": att.name, "employee": emp, "attendance_date": str(attendance_date),
+                                    "action": "update", **{k: str(v or "") for k, v in changes.items()}})
+
+    report.attendance_updated += len(updates)
+    report.attendance_created += len(creates)
+
+    if report.dry_run:
+        return
+
+    ## Records keeping their status take the new times in place, a status change goes through cancel and amend
+    for idx, (name, changes) in enumerate(updates, start=1):
+        if "status" in changes:
+            amend_attendance(name, changes)
+            continue
+        frappe.db.set_value("Attendance", name, changes)
+        if idx % REBUILD_APPLY_BATCH_SIZE == 0:
+            frappe.db.commit()
+    frappe.db.commit()
+    if updates:
+        ## In-place updates skip the Attendance hooks, the payroll matrix holds the overtime hours
+        invalidate_period_matrix(from_date, to_date)
+
+    for emp, attendance_date, state in creates:
+        try:
+            window = get_shift_window(state["shift"] or get_shift_at(emp, attendance_date))
+            working_hours = compute_metrics(attendance_date, state["in_time"], state["out_time"], window)["working_hours"]
+            status = get_attendance_status(state["in_time"], state["out_time"], working_hours, window)
+            make_attendance(emp, attendance_date, status=status, in_time=state["in_time"],
+                            out_time=state["out_time"], shift_code=state["shift"])
+        except Exception:
+            frappe.log_error(frappe.get_traceback(), f"Attendance rebuild failed for employee {emp} on {attendance_date}")
+            frappe.db.rollback()
+
+
+def get_derived_changes(att, state):
+    """
+    The working hours, lateness and status the replayed times give the attendance, against its shift window
+    and the shift's working hours thresholds. Leave and work from home records keep their status
+    """
+    attendance_date = getdate(att.attendance_date)
+    window = get_shift_window(att.shift or get_shift_at(att.employee, attendance_date))
+    metrics = compute_metrics(attendance_date, state["in_time"], state["out_time"], window)
+
+    changes = {field: value for field, value in metrics.items() if flt(att.get(field)) != flt(value)}
+    if att.status in ("Present", "Absent", "Half Day"):
+        status = get_attendance_status(state["in_time"], state["out_time"], metrics["working_hours"], window)
+        if status != att.status:
+            changes["status"] = status
+    return changes
+
+
+def amend_attendance(name, changes):
+    """
+    Cancel a submitted attendance and submit an amendment with the rebuilt times and status,
+    so the change is validated and kept in the record's history
+    """
+    try:
+        att = frappe.get_doc("Attendance", name)
+        if att.docstatus != 1:
+            att.update(changes)
+            att.save(ignore_permissions=True)
+        else:
+            att.flags.ignore_permissions = True
+            att.cancel()
+            amended = frappe.copy_doc(att)
+            amended.update(changes)
+            amended.docstatus = 0
+            amended.amended_from = att.name
+            amended.insert(ignore_permissions=True)
+            amended.submit()
+        frappe.db.commit()
+    except Exception:
+        frappe.db.rollback()
+        frappe.log_error(frappe.get_traceback(), f"Attendance rebuild failed to amend {name}")
+
+
+def iter_checkins(from_date, to_date, employee=None):
+    """
+    Stream the checkins in [from_date, to_date) ordered by employee and time.
+    Uses keyset pagination on (employee, time, name) so only one page is held in memory
+    """
+    conditions = ["time >= %(start)s", "time < %(end)s"]
+    values = {"start": get_datetime(from_date), "end": get_datetime(to_date), "page_size": REBUILD_PAGE_SIZE}
+    if employee:
+        conditions.append("employee = %(employee)s")
+        values["employee"] = employee
+
+    last = None
+    while True:
+        page_conditions = list(conditions)
+        if last:
+            page_conditions.append("(employee, time, name) > (%(last_employee)s, %(last_time)s, %(last_name)s)")
+            values.update({"last_employee": last.employee, "last_time": last.time, "last_name": last.name})
+
+        rows = frappe.db.sql(f"""
+                    SELECT name, employee, time, log_type, device_id, shift, skip_auto_attendance
+                    FROM `tabEmployee Checkin`
+                    WHERE {" AND ".join(page_conditions)}
+                    ORDER BY employee, time, name
+                    LIMIT %(page_size)s
+                    """, values, as_dict=True)
+        if not rows:
+            return
+
+        yield from rows
+        if len(rows) < REBUILD_PAGE_SIZE:
+            return
+        last = rows[-1]
+
+
+def get_last_punch_before(from_date, employee=None):
+    """
+    Get each employee's last log type and time before the range in one query
+    """
+    employee_condition = "AND employee = %(employee)s" if employee else ""
+    rows = frappe.db.sql(f"""
+                SELECT c.employee, c.log_type, c.time
+                FROM `tabEmployee Checkin` AS c JOIN (
+                        SELECT employee, MAX(time) AS last_time
+                        FROM `tabEmployee Checkin`
+                        WHERE time < %(start)s AND skip_auto_attendance = 0 {employee_condition}
+                        GROUP BY employee) x
+                ON x.employee = c.employee AND x.last_time = c.time
+                """, {"start": get_datetime(from_date), "employee": employee}, as_dict=True)
+    return {row.employee: (row.log_type, row.time) for row in rows}
+
+
+def get_existing_attendance(employees, from_date, to_date):
+    """
+    Get the non-cancelled attendance of the employees within the range keyed by (employee, date)
+    """
+    attendances = frappe.get_all("Attendance",
+                                 filters={
+                                     "employee": ["in", employees],
+                                     "attendance_date": ["between", [from_date, to_date]],
+                                     "docstatus": ["!=", 2]
+                                 },
+                                 fields=["name", "employee", "attendance_date", "in_time", "out_time", "status",
+                                         "shift", *METRIC_FIELDS])
+    return {(att.employee, getdate(att.attendance_date)): att for att in attendances}
+
+
+def update_checkin_log_types(changes):
+    """
+    Update the checkin log types with one statement per log type
+    """
+    by_log_type = {}
+    for name, log_type in changes:
+        by_log_type.setdefault(log_type, []).append(name)
+
+    for log_type, names in by_log_type.items():
+        frappe.db.sql("""
+                UPDATE `tabEmployee Checkin` SET log_type = %s
+                WHERE name IN %s
+                """, (log_type, tuple(names)))
+    frappe.db.commit()
+
+
+def same_time(existing, replayed):
+    if not existing and not replayed:
+        return True
+    if not existing or not replayed:
+        return False
+    return get_datetime(existing) == get_datetime(replayed)
+
+
+def add_sample(report, row):
+    if len(report.samples) < REBUILD_REPORT_SAMPLE_SIZE:
+        report.samples.append(row)
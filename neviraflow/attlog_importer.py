@@ -0,0 +1,175 @@
+from datetime import datetime
+
+import frappe
+from frappe import _
+from frappe.utils import getdate
+
+from neviraflow.checkin_ingest import resolve_punches, get_existing_punches, bulk_insert_checkins
+from neviraflow.punch_dedup import drop_window_duplicates
+
+
+IMPORT_CHUNK_SIZE = 5000
+IMPORT_PROGRESS_EVENT = "attlog_import_progress"
+TIMESTAMP_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M")
+
+
+@frappe.whitelist()
+def import_attlog(file_url):
+    """
+    Queue the import of an ATTLOG (.dat) or CSV attendance dump uploaded as a File
+    """
+    frappe.only_for(("HR Manager", "System Manager"))
+
+    if not frappe.db.exists("File", {"file_url": file_url}):
+        frappe.throw(_("File {0} not found").format(file_url))
+
+    frappe.enqueue(
+        "neviraflow.attlog_importer.run_attlog_import",
+        queue="long",
+        timeout=7200,
+        file_url=file_url,
+        user=frappe.session.user,
+    )
+    frappe.msgprint(_("Attendance log import has been queued"))
+
+
+def run_attlog_import(file_url=None, path=None, user=None):
+    """
+    Stream the dump line by line in chunks so memory stays constant for any file size.
+    Each chunk is mapped to employees, checked against the punches already stored and bulk inserted.
+    Attendance for the imported punches is then rebuilt per employee over the imported date range.
+    """
+    if not path:
+        path = frappe.get_doc("File", {"file_url": file_url}).get_full_path()
+
+    summary = frappe._dict({
+        "lines": 0,
+        "inserted": 0,
+        "duplicates": 0,
+        "invalid": 0,
+        "unmatched": set(),
+        "employees": set(),
+        "from_date": None,
+        "to_date": None
+    })
+
+    with open(path, encoding="utf-8", errors="replace") as f:
+        chunk = []
+        for line in f:
+            summary.lines += 1
+            punch = parse_line(line)
+            if not punch:
+                summary.invalid += 1
+                continue
+            chunk.append(punch)
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                import_chunk(chunk, summary)
+                chunk = []
+                publish_progress(summary, user)
+        import_chunk(chunk, summary)
+
+    rebuild_imported_attendance(summary)
+
+    result = {
+        "lines": summary.lines,
+        "inserted": summary.inserted,
+        "duplicates": summary.duplicates,
+        "invalid": summary.invalid,
+        "unmatched": sorted(summary.unmatched),
+        "from_date": str(summary.from_date) if summary.from_date else None,
+        "to_date": str(summary.to_date) if summary.to_date else None
+    }
+    if user:
+        frappe.publish_realtime(IMPORT_PROGRESS_EVENT, {"done": 1, **result}, user=user)
+    return result
+
+
+def import_chunk(chunk, summary):
+    """
+    Insert one chunk of punches, skipping the ones already present and double taps within the de-dup window.
+    The (employee, timestamp) set only holds this chunk's punches plus the stored ones it overlaps.
+    """
+    if not chunk:
+        return
+
+    rows, unmatched = resolve_punches(chunk)
+    summary.unmatched.update(unmatched)
+    rows.sort(key=lambda row: (row.employee, row.time))
+
+    seen = get_existing_punches(rows)
+    new_rows = []
+    for row in rows:
+        key = (row.employee, row.time)
+        if key in seen:
+            summary.duplicates += 1
+            continue
+        seen.add(key)
+        new_rows.append(row)
+
+    new_rows, dropped = drop_window_duplicates(new_rows)
+    summary.duplicates += dropped
+
+    summary.inserted += bulk_insert_checkins(new_rows)
+    frappe.db.commit()
+
+    for row in new_rows:
+        summary.employees.add(row.employee)
+        day = getdate(row.time)
+        if not summary.from_date or day < summary.from_date:
+            summary.from_date = day
+        if not summary.to_date or day > summary.to_date:
+            summary.to_date = day
+
+
+def rebuild_imported_attendance(summary):
+    """
+    Build attendance for the imported punches with the same rules as the checkin hooks
+    """
+    from neviraflow.attendance_rebuild import run_attendance_rebuild
+
+    if not summary.employees:
+        return
+
+    for employee in sorted(summary.employees):
+        try:
+            run_attendance_rebuild(summary.from_date, summary.to_date, employee=employee, dry_run=0)
+        except Exception:
+            frappe.log_error(frappe.get_traceback(), f"Attendance rebuild after ATTLOG import failed for {employee}")
+            frappe.db.rollback()
+
+
+def parse_line(line):
+    """
+    Parse one line of an ATTLOG dump (PIN <tab> timestamp <tab> status ...) or a CSV export
+    (user id, timestamp, ...). Header and malformed lines return None
+    """
+    line = line.strip()
+    if not line:
+        return None
+
+    parts = line.split("\t") if "\t" in line else line.split(",")
+    if len(parts) < 2:
+        return None
+
+    device_user_id = parts[0].strip().strip('"')
+    timestamp = parse_timestamp(parts[1].strip().strip('"'))
+    if not device_user_id or not timestamp:
+        return None
+
+    return {"device_user_id": device_user_id, "timestamp": timestamp}
+
+
+def parse_timestamp(value):
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def publish_progress(summary, user):
+    if user:
+        frappe.publish_realtime(IMPORT_PROGRESS_EVENT,
+                                {"lines": summary.lines, "inserted": summary.inserted, "duplicates": summary.duplicates},
+                                user=user)
@@ -0,0 +1,412 @@
+"""
+Asyncio listener for ZKTeco push (ADMS / iclock) traffic.
+
+Devices push their attendance logs over HTTP. Every punch is written to a local sqlite queue
+before the device is acknowledged, and a forwarder sends the queued punches in batches to
+neviraflow.checkin_ingest.bulk_add_checkins over a pooled HTTP session. Punches that were not
+forwarded when the process stops stay in the queue and are sent on the next start.
+
+Run it from the bench environment:
+    python -m neviraflow.biometric_listener --config /path/to/listener.json
+
+SIGTERM/SIGINT stop accepting connections, let in-flight requests finish and flush the queue.
+SIGHUP reloads the config file without dropping the server.
+This module deliberately does not import frappe, it runs outside the bench web workers.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+
+DEFAULT_CONFIG = {
+    "host": "0.0.0.0",
+    "port": 5000,
+    "site_url": "http://localhost:8000",
+    "api_key": "",
+    "api_secret": "",
+    "queue_path": "biometric_queue.sqlite3",
+    "batch_size": 500,
+    "flush_interval": 5,
+    "request_timeout": 30,
+    "max_backoff": 60,
+    "max_retry_backoff": 3600,
+    "shutdown_timeout": 20,
+}
+
+BULK_CHECKIN_METHOD = "/api/method/neviraflow.checkin_ingest.bulk_add_checkins"
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 8 * 1024 * 1024
+
+logger = logging.getLogger("neviraflow.biometric_listener")
+
+
+def load_config(path=None):
+    """
+    Build the config from the defaults, the optional JSON file and NEVIRAFLOW_LISTENER_* env variables
+    """
+    config = dict(DEFAULT_CONFIG)
+    if path:
+        with open(path) as f:
+            config.update(json.load(f))
+
+    for key in DEFAULT_CONFIG:
+        env_value = os.environ.get(f"NEVIRAFLOW_LISTENER_{key.upper()}")
+        if env_value is not None:
+            config[key] = type(DEFAULT_CONFIG[key])(env_value)
+    return config
+
+
+class PunchQueue:
+    """
+    Durable FIFO of punches backed by sqlite, safe to use from worker threads
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS punches (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                device_sn TEXT,
+                device_user_id TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                status TEXT,
+                received_at TEXT NOT NULL
+            )""")
+        ## Queues created before retries were tracked get the retry columns added
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(punches)")}
+        if "attempts" not in columns:
+            self.conn.execute("ALTER TABLE punches ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        if "next_attempt_at" not in columns:
+            self.conn.execute("ALTER TABLE punches ADD COLUMN next_attempt_at REAL NOT NULL DEFAULT 0")
+
+    def put_many(self, punches):
+        if not punches:
+            return
+        received_at = datetime.now().isoformat(sep=" ", timespec="seconds")
+        with self.lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT INTO punches (device_sn, device_user_id, timestamp, status, received_at) VALUES (?, ?, ?, ?, ?)",
+                [(p["device_sn"], p["device_user_id"], p["timestamp"], p["status"], received_at) for p in punches],
+            )
+            self.conn.execute("COMMIT")
+
+    def peek(self, limit):
+        """
+        The oldest punches that are due, punches waiting out a retry backoff are skipped
+        """
+        with self.lock:
+            return self.conn.execute(
+                """SELECT id, device_sn, device_user_id, timestamp, status, attempts FROM punches
+                WHERE next_attempt_at <= ? ORDER BY id LIMIT ?""", (time.time(), limit)
+            ).fetchall()
+
+    def delete(self, ids):
+        if not ids:
+            return
+        with self.lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("DELETE FROM punches WHERE id = ?", [(id,) for id in ids])
+            self.conn.execute("COMMIT")
+
+    def defer(self, retries):
+        """
+        Keep punches queued for another attempt, retries is a list of (id, delay in seconds)
+        """
+        if not retries:
+            return
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "UPDATE punches SET attempts = attempts + 1, next_attempt_at = ? WHERE id = ?",
+                [(now + delay, id) for id, delay in retries],
+            )
+            self.conn.execute("COMMIT")
+
+    def size(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM punches").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def parse_attlog(body, device_sn):
+    """
+    Parse ATTLOG lines: PIN <tab> YYYY-MM-DD HH:MM:SS <tab> status <tab> verify ...
+    """
+    punches = []
+    for line in body.splitlines():
+        parts = line.strip().split("\t")
+        if len(parts) < 2 or not parts[0]:
+            continue
+        try:
+            datetime.strptime(parts[1].strip(), "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            logger.warning("Skipping malformed ATTLOG line from %s: %r", device_sn, line)
+            continue
+        punches.append({
+            "device_sn": device_sn,
+            "device_user_id": parts[0].strip(),
+            "timestamp": parts[1].strip(),
+            "status": parts[2].strip() if len(parts) > 2 else None,
+        })
+    return punches
+
+
+class BiometricListener:
+    def __init__(self, config_path=None):
+        self.config_path = config_path
+        self.config = load_config(config_path)
+        self.queue = PunchQueue(self.config["queue_path"])
+        self.session = self.make_session()
+        self.server = None
+        self.stopping = asyncio.Event()
+        self.wake_forwarder = asyncio.Event()
+        self.in_flight = set()
+
+    def make_session(self):
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update({
+            "Authorization": f"token {self.config['api_key']}:{self.config['api_secret']}",
+            "Accept": "application/json",
+        })
+        return session
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, self.stopping.set)
+        loop.add_signal_handler(signal.SIGINT, self.stopping.set)
+        loop.add_signal_handler(signal.SIGHUP, self.reload)
+
+        self.server = await asyncio.start_server(self.handle_connection, self.config["host"], self.config["port"])
+        logger.info("Listening on %s:%s, %s punches waiting in the queue",
+                    self.config["host"], self.config["port"], self.queue.size())
+
+        forwarder = asyncio.create_task(self.forward_loop())
+        await self.stopping.wait()
+
+        logger.info("Shutting down, no new connections will be accepted")
+        self.server.close()
+        if self.in_flight:
+            await asyncio.wait(self.in_flight, timeout=self.config["shutdown_timeout"])
+
+        self.wake_forwarder.set()
+        try:
+            await asyncio.wait_for(forwarder, timeout=self.config["shutdown_timeout"])
+        except asyncio.TimeoutError:
+            forwarder.cancel()
+        logger.info("Stopped, %s punches left in the queue for the next start", self.queue.size())
+        self.queue.close()
+        self.session.close()
+
+    def reload(self):
+        """
+        Reload the config file and rebuild the HTTP session, the server keeps running
+        """
+        try:
+            new_config = load_config(self.config_path)
+        except Exception:
+            logger.exception("Config reload failed, keeping the current config")
+            return
+        if (new_config["host"], new_config["port"], new_config["queue_path"]) != \
+                (self.config["host"], self.config["port"], self.config["queue_path"]):
+            logger.warning("host, port and queue_path changes only apply after a restart")
+            new_config.update({k: self.config[k] for k in ("host", "port", "queue_path")})
+        self.config = new_config
+        old_session, self.session = self.session, self.make_session()
+        old_session.close()
+        logger.info("Config reloaded")
+
+    async def handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self.in_flight.add(task)
+        try:
+            request = await read_request(reader)
+            if request:
+                status, body = await self.dispatch(*request)
+                await write_response(writer, status, body)
+        except Exception:
+            logger.exception("Failed handling device request")
+            try:
+                await write_response(writer, 500, "ERROR")
+            except Exception:
+                pass
+        finally:
+            writer.close()
+            self.in_flight.discard(task)
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        device_sn = params.get("SN", "")
+        path = url.path.rstrip("/")
+
+        if path == "/iclock/cdata" and method == "GET":
+            return 200, handshake_response(device_sn)
+
+        if path == "/iclock/cdata" and method == "POST":
+            if params.get("table") != "ATTLOG":
+                ## OPERLOG, user info and photos are not needed, acknowledge them so the device moves on
+                return 200, "OK"
+            punches = parse_attlog(body, device_sn)
+            ## Only acknowledge once the punches are durable
+            await asyncio.to_thread(self.queue.put_many, punches)
+            if len(punches) >= self.config["batch_size"]:
+                self.wake_forwarder.set()
+            return 200, f"OK: {len(punches)}"
+
+        if path in ("/iclock/getrequest", "/iclock/devicecmd"):
+            return 200, "OK"
+
+        return 404, "Not Found"
+
+    async def forward_loop(self):
+        backoff = self.config["flush_interval"]
+        while True:
+            try:
+                await asyncio.wait_for(self.wake_forwarder.wait(), timeout=backoff)
+            except asyncio.TimeoutError:
+                pass
+            self.wake_forwarder.clear()
+
+            try:
+                while await asyncio.to_thread(self.forward_batch):
+                    pass
+                backoff = self.config["flush_interval"]
+            except Exception:
+                backoff = min(backoff * 2, self.config["max_backoff"])
+                logger.exception("Forwarding failed, retrying in %ss", backoff)
+
+            if self.stopping.is_set():
+                return
+
+    def forward_batch(self):
+        """
+        Send the oldest due batch to the site and drop the punches the site has taken from the queue.
+        Punches the site reports as failed stay queued and are retried with an increasing backoff.
+        Returns True when a full batch was sent and more may be waiting
+        """
+        rows = self.queue.peek(self.config["batch_size"])
+        if not rows:
+            return False
+
+        punches = [
+            {"device_user_id": device_user_id, "timestamp": timestamp}
+            for _id, _device_sn, device_user_id, timestamp, _status, _attempts in rows
+        ]
+        ## No log_type or device_id is sent so the checkin hooks infer IN/OUT from the employee's sequence
+        response = self.session.post(
+            self.config["site_url"].rstrip("/") + BULK_CHECKIN_METHOD,
+            data={"punches": json.dumps(punches)},
+            timeout=self.config["request_timeout"],
+        )
+        response.raise_for_status()
+        result = response.json().get("message") or {}
+        if result.get("unmatched"):
+            logger.warning("No employee found for device users %s", result["unmatched"])
+
+        failed = {(str(p.get("device_user_id")), str(p.get("timestamp"))) for p in result.get("failed_punches") or []}
+        accepted, retries = [], []
+        for id, _device_sn, device_user_id, timestamp, _status, attempts in rows:
+            if (str(device_user_id), str(timestamp)) in failed:
+                retries.append((id, self.retry_delay(attempts)))
+            else:
+                accepted.append(id)
+
+        self.queue.delete(accepted)
+        self.queue.defer(retries)
+        if retries:
+            logger.warning("%s punches failed on the site and stay queued for a retry", len(retries))
+        logger.info("Forwarded %s punches: %s", len(rows), result)
+        return len(rows) == self.config["batch_size"]
+
+    def retry_delay(self, attempts):
+        return min(self.config["flush_interval"] * 2 ** (attempts + 1), self.config["max_retry_backoff"])
+
+
+def handshake_response(device_sn):
+    return "\n".join([
+        f"GET OPTION FROM: {device_sn}",
+        "ATTLOGStamp=None",
+        "OPERLOGStamp=9999",
+        "ATTPHOTOStamp=None",
+        "ErrorDelay=30",
+        "Delay=10",
+        "TransTimes=00:00;14:05",
+        "TransInterval=1",
+        "TransFlag=TransData AttLog",
+        "Realtime=1",
+        "Encrypt=None",
+    ])
+
+
+async def read_request(reader):
+    """
+    Read one HTTP/1.x request, returns (method, target, body) or None if the peer went away
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        return None
+    if len(head) > MAX_HEADER_BYTES:
+        return None
+
+    lines = head.decode("latin-1").split("\r\n")
+    method, target, _version = lines[0].split(" ", 2)
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            key, value = line.split(":", 1)
+            headers[key.strip().lower()] = value.strip()
+
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY_BYTES:
+        return None
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, body.decode("utf-8", errors="replace")
+
+
+async def write_response(writer, status, body):
+    reason = {200: "OK", 404: "Not Found", 500: "Internal Server Error"}.get(status, "OK")
+    payload = body.encode("utf-8")
+    writer.write(
+        f"HTTP/1.1 {status} {reason}\r\n"
+        f"Content-Type: text/plain\r\n"
+        f"Content-Length: {len(payload)}\r\n"
+        f"Date: {datetime.utcnow().strftime('%a, %d %b %Y %H:%M:%S GMT')}\r\n"
+        f"Connection: close\r\n\r\n".encode("latin-1") + payload
+    )
+    await writer.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ZKTeco push listener for neviraflow")
+    parser.add_argument("--config", help="Path to the JSON config file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    asyncio.run(BiometricListener(args.config).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import json
+
+import frappe
+from frappe import _
+from frappe.model.naming import make_autoname
+from frappe.utils import get_datetime, now_datetime
+
+from neviraflow.punch_dedup import drop_window_duplicates, remember_punch
+
+
+DEVICE_USER_MAP_KEY = "neviraflow_device_user_map"
+BULK_CHECKIN_MAX_BATCH = 2000
+
+
+@frappe.whitelist()
+def bulk_add_checkins(punches):
+    """
+    Insert a batch of biometric punches as Employee Checkins.
+    Each punch is a dict with device_user_id (or employee), timestamp and optionally log_type and device_id.
+    Punches already present for the same (employee, time) are skipped so a batch can safely be resent,
+    and punches within the de-dup window of the employee's previous punch are dropped.
+    Punches that fail to insert are returned as sent in failed_punches so the sender can keep them for a retry.
+    The checkins are inserted in (employee, time) order so the checkin hooks infer log types in sequence.
+    The caller (the device integration user) needs create permission on Employee Checkin.
+    """
+    frappe.has_permission("Employee Checkin", "create", throw=True)
+
+    if isinstance(punches, str):
+        punches = json.loads(punches)
+
+    if len(punches) > BULK_CHECKIN_MAX_BATCH:
+        frappe.throw(_("A batch cannot have more than {0} punches").format(BULK_CHECKIN_MAX_BATCH))
+
+    result = {"inserted": 0, "duplicates": 0, "unmatched": [], "failed": 0, "failed_punches": []}
+
+    rows, unmatched = resolve_punches(punches)
+    result["unmatched"] = unmatched
+
+    existing = get_existing_punches(rows)
+    rows.sort(key=lambda row: (row.employee, row.time))
+
+    new_rows = []
+    for row in rows:
+        key = (row.employee, row.time)
+        if key in existing:
+            result["duplicates"] += 1
+            continue
+        existing.add(key)
+        new_rows.append(row)
+
+    new_rows, dropped = drop_window_duplicates(new_rows)
+    result["duplicates"] += dropped
+
+    for row in new_rows:
+        try:
+            checkin = frappe.new_doc("Employee Checkin")
+            checkin.update({
+                "employee": row.employee,
+                "time": row.time,
+                "log_type": row.log_type,
+                "device_id": row.device_id
+            })
+            checkin.insert(ignore_permissions=True)
+            frappe.db.commit()
+            result["inserted"] += 1
+        except Exception:
+            result["failed"] += 1
+            result["failed_punches"].append({"device_user_id": row.device_user_id, "timestamp": row.timestamp})
+            frappe.db.rollback()
+            frappe.log_error(frappe.get_traceback(), f"Bulk checkin failed for employee {row.employee} at {row.time}")
+
+    return result
+
+
+def resolve_punches(punches):
+    """
+    Map the punches' device user ids to employees.
+    Returns the resolved rows and the distinct device user ids without an employee
+    """
+    device_users = get_device_user_map()
+    rows, unmatched = [], set()
+    for punch in punches:
+        punch = frappe._dict(punch)
+        employee = punch.employee or device_users.get(str(punch.device_user_id or "").strip())
+        if not employee:
+            unmatched.add(punch.device_user_id)
+            continue
+        rows.append(frappe._dict({
+            "employee": employee,
+            "device_user_id": punch.device_user_id,
+            "timestamp": punch.timestamp,
+            "time": get_datetime(punch.timestamp),
+            "log_type": punch.log_type,
+            "device_id": punch.device_id
+        }))
+    return rows, list(unmatched)
+
+
+def bulk_insert_checkins(rows):
+    """
+    Insert checkins in one multi-row statement without running the checkin hooks.
+    Used for historical imports, attendance for those punches is then built by the attendance rebuild.
+    """
+    if not rows:
+        return 0
+
+    employee_names = dict(frappe.get_all("Employee",
+                                         filters={"name": ["in", list({row.employee for row in rows})]},
+                                         fields=["name", "employee_name"],
+                                         as_list=True))
+    ## Follow the doctype's series (e.g EMP-CKIN-.MM.-.YYYY.-.######) when it's a plain expression
+    autoname = frappe.get_meta("Employee Checkin").autoname or ""
+    use_series = "." in autoname and ":" not in autoname
+    now = now_datetime()
+    user = frappe.session.user
+
+    values = []
+    for row in rows:
+        name = make_autoname(autoname, "Employee Checkin") if use_series else frappe.generate_hash(length=10)
+        values.append((name, now, now, user, user, row.employee, employee_names.get(row.employee),
+                       row.time, row.log_type, row.device_id))
+
+    frappe.db.bulk_insert(
+        "Employee Checkin",
+        fields=["name", "creation", "modified", "owner", "modified_by", "employee", "employee_name",
+                "time", "log_type", "device_id"],
+        values=values,
+    )
+
+    latest = {}
+    for row in rows:
+        if row.employee not in latest or row.time > latest[row.employee]:
+            latest[row.employee] = row.time
+    for employee, ts in latest.items():
+        remember_punch(employee, ts)
+
+    return len(values)
+
+
+def get_existing_punches(rows):
+    """
+    Get the (employee, time) pairs of the batch that already exist as checkins, in one query
+    """
+    if not rows:
+        return set()
+
+    employees = list({row.employee for row in rows})
+    times = [row.time for row in rows]
+    checkins = frappe.get_all("Employee Checkin",
+                              filters={
+                                  "employee": ["in", employees],
+                                  "time": ["between", [min(times), max(times)]]
+                              },
+                              fields=["employee", "time"])
+    return {(c.employee, get_datetime(c.time)) for c in checkins}
+
+
+def get_device_user_map():
+    """
+    Get the biometric device user id to employee mapping, cached until an Employee changes
+    """
+    def build_map():
+        employees = frappe.get_all("Employee",
+                                   filters={"attendance_device_id": ["is", "set"]},
+                                   fields=["name", "attendance_device_id"])
+        return {str(emp.attendance_device_id).strip(): emp.name for emp in employees}
+
+    return frappe.cache().get_value(DEVICE_USER_MAP_KEY, build_map)
+
+
+def clear_device_user_map(doc=None, method=None):
+    """
+    Employee hook: drop the cached device user mapping
+    """
+    frappe.cache().delete_value(DEVICE_USER_MAP_KEY)
@@ -0,0 +1,78 @@
+import click
+import frappe
+from frappe.commands import get_site, pass_context
+
+
+@click.command("backfill-absentees")
+@click.option("--from-date", required=True, help="First day to mark, YYYY-MM-DD")
+@click.option("--to-date", required=True, help="Last day to mark, YYYY-MM-DD")
+@click.option("--dry-run", is_flag=True, default=False, help="Only report the rows that would be created")
+@pass_context
+def backfill_absentees(context, from_date, to_date, dry_run=False):
+    """
+    Mark absentees for the days the scheduled absentee job did not run
+    """
+    from neviraflow.attendance_backfill import backfill_absentees as run_backfill
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    try:
+        frappe.set_user("Administrator")
+        result = run_backfill(from_date, to_date, dry_run=int(dry_run))
+        frappe.db.commit()
+        click.echo(f"Absent records {'found' if dry_run else 'queued'}: {result['total']}")
+    finally:
+        frappe.destroy()
+
+
+@click.command("rebuild-attendance")
+@click.option("--from-date", required=True, help="First day to rebuild, YYYY-MM-DD")
+@click.option("--to-date", required=True, help="Last day to rebuild, YYYY-MM-DD")
+@click.option("--employee", default=None, help="Only rebuild this employee")
+@click.option("--apply", "apply_changes", is_flag=True, default=False, help="Apply the changes, by default only a dry-run report is printed")
+@pass_context
+def rebuild_attendance(context, from_date, to_date, employee=None, apply_changes=False):
+    """
+    Rebuild Attendance in/out times from the Employee Checkins in the range
+    """
+    from neviraflow.attendance_rebuild import run_attendance_rebuild
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    try:
+        frappe.set_user("Administrator")
+        report = run_attendance_rebuild(from_date, to_date, employee=employee, dry_run=0 if apply_changes else 1)
+        click.echo(f"Checkins scanned: {report.checkins_scanned}")
+        click.echo(f"Log type changes: {report.log_type_changes}")
+        click.echo(f"Attendance updated: {report.attendance_updated}")
+        click.echo(f"Attendance created: {report.attendance_created}")
+        for row in report.samples:
+            click.echo(frappe.as_json(row, indent=None))
+    finally:
+        frappe.destroy()
+
+
+@click.command("import-attlog")
+@click.argument("paths", nargs=-1, required=True)
+@pass_context
+def import_attlog(context, paths):
+    """
+    Import ZKTeco ATTLOG (.dat) or CSV attendance dumps into Employee Checkin
+    """
+    from neviraflow.attlog_importer import run_attlog_import
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    try:
+        frappe.set_user("Administrator")
+        for path in paths:
+            result = run_attlog_import(path=path)
+            click.echo(f"{path}: {frappe.as_json(result, indent=None)}")
+    finally:
+        frappe.destroy()
+
+
+commands = [backfill_absentees, rebuild_attendance, import_attlog]
@@ -1,6 +1,12 @@
 import frappe
 from frappe import _ 
-from frappe.utils import flt
+from frappe.utils import flt, cint, now_datetime
+from frappe.utils.caching import request_cache
+
+from neviraflow.party_balance import get_party_balance
+
+
+CREDIT_WARNING_THRESHOLD = 60
 
 
 class CreditLimitExceedError(frappe.ValidationError):
@@ -10,6 +16,10 @@ class CreditLimitExceedError(frappe.ValidationError):
 def validate_credit_limit(doc, method=None):
     if not doc.customer:
         return
+
+    ## Nothing the check depends on changed since the last save, e.g. only a remark was edited
+    if not credit_inputs_changed(doc):
+        return
     
     customer_credit_limit = get_customer_credit_limit(doc.customer)
     
@@ -56,7 +66,7 @@ def validate_credit_limit(doc, method=None):
             exc=CreditLimitExceedError,
         )
 
-    elif credit_utilization_percentage >= 60:
+    elif credit_utilization_percentage >= CREDIT_WARNING_THRESHOLD:
         frappe.msgprint(
             _("High Credit Utilization for {0} </br>"
               "Credit Limit: {1} </br>"
@@ -74,26 +84,35 @@ def validate_credit_limit(doc, method=None):
             indicator = "orange"
         )
 
+def credit_inputs_changed(doc):
+    """
+    Compare the fingerprint of the inputs of the credit check (customer, order amount, docstatus)
+    with the one of the last saved version of the order
+    """
+    if doc.is_new():
+        return True
+
+    previous = doc.get_doc_before_save()
+    if not previous:
+        return True
+
+    return get_credit_fingerprint(previous) != get_credit_fingerprint(doc)
+
+
+def get_credit_fingerprint(doc):
+    return (doc.customer, flt(get_sales_order_amount(doc), 2), doc.docstatus)
+
+
+@request_cache
 def get_customer_outstanding_amount(customer):
     """
-    From the GL entry, get the total outstanding amount for the customer.
+    From the maintained party balances, get the total outstanding amount for the customer.
     The balance will represent the total amount the customer owes the company
     """
+    return get_party_balance(customer, "Customer")
 
-    gl_query = frappe.db.sql("""
-                    SELECT (SUM(debit) - SUM(credit)) AS outstanding_amount
-                    FROM `tabGL Entry`
-                    WHERE party_type = 'Customer'
-                    AND docstatus = 1
-                    AND is_cancelled = 0
-                    AND party = %s
-                """,(customer),as_dict=True)
-    if gl_query:
-        return gl_query[0]["outstanding_amount"]
-    else:
-        return 0
-    
 
+@request_cache
 def get_customer_credit_limit(customer):
     """
     From the credit limit child table, get the customer's credit limit amount
@@ -129,3 +148,84 @@ def check_customer_credit_status(customer):
         "credit_utilization_percentage": ((outstanding_amount / credit_limit) * 100) if credit_limit > 0 else 0
     }
 
+
+@frappe.whitelist()
+def get_customers_credit_status(customers=None):
+    """
+    Get the credit limit, outstanding amount, utilization and available credit of a list of customers,
+    or of every customer with a credit limit, with one grouped query over the credit limits and the
+    maintained party balances
+    """
+    frappe.has_permission("Customer", "read", throw=True)
+
+    if isinstance(customers, str):
+        customers = frappe.parse_json(customers)
+
+    customer_condition = "c.name IN %(customers)s" if customers else "ccl.credit_limit > 0"
+    rows = frappe.db.sql(f"""
+                SELECT
+                    c.name AS customer,
+                    c.customer_name,
+                    IFNULL(MAX(ccl.credit_limit), 0) AS credit_limit,
+                    IFNULL(pb.balance, 0) AS outstanding_amount
+                FROM `tabCustomer` c
+                LEFT JOIN `tabCustomer Credit Limit` ccl
+                    ON ccl.parent = c.name AND ccl.parenttype = 'Customer' AND ccl.credit_limit > 0
+                LEFT JOIN (
+                    SELECT party, SUM(balance) AS balance
+                    FROM `tabParty Balance`
+                    WHERE party_type = 'Customer'
+                    GROUP BY party
+                ) pb ON pb.party = c.name
+                WHERE {customer_condition}
+                GROUP BY c.name, c.customer_name, pb.balance
+                ORDER BY c.name
+                """, {"customers": tuple(customers or [])}, as_dict=True)
+
+    for row in rows:
+        row.credit_limit = flt(row.credit_limit)
+        row.outstanding_amount = flt(row.outstanding_amount)
+        row.credit_utilization_percentage = round((row.outstanding_amount / row.credit_limit) * 100, 2) if row.credit_limit > 0 else 0
+        row.available_credit = row.credit_limit - row.outstanding_amount
+        row.above_warning_threshold = cint(row.credit_utilization_percentage >= CREDIT_WARNING_THRESHOLD)
+    return rows
+
+
+def refresh_credit_snapshot():
+    """
+    Scheduled job: rebuild the Customer Credit Snapshot table from the bulk credit status
+    so the sales dashboard reads precomputed rows
+    """
+    rows = get_customers_credit_status()
+    now = now_datetime()
+
+    frappe.db.delete("Customer Credit Snapshot")
+    frappe.db.bulk_insert(
+        "Customer Credit Snapshot",
+        fields=["name", "creation", "modified", "owner", "modified_by", "docstatus",
+                "customer", "customer_name", "credit_limit", "outstanding_amount",
+                "credit_utilization_percentage", "available_credit", "above_warning_threshold", "snapshot_on"],
+        values=[
+            (row.customer, now, now, "Administrator", "Administrator", 0,
+             row.customer, row.customer_name, row.credit_limit, row.outstanding_amount,
+             row.credit_utilization_percentage, row.available_credit, row.above_warning_threshold, now)
+            for row in rows
+        ]
+    )
+    frappe.db.commit()
+    return len(rows)
+
+
+@frappe.whitelist()
+def get_credit_snapshot(only_flagged=0):
+    """
+    Get the latest credit snapshot, optionally only the customers above the warning threshold
+    """
+    filters = {"above_warning_threshold": 1} if cint(only_flagged) else {}
+    return frappe.get_list("Customer Credit Snapshot",
+                           filters=filters,
+                           fields=["customer", "customer_name", "credit_limit", "outstanding_amount",
+                                   "credit_utilization_percentage", "available_credit",
+                                   "above_warning_threshold", "snapshot_on"],
+                           order_by="credit_utilization_percentage desc",
+                           limit_page_length=0)
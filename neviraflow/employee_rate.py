@@ -1,11 +1,22 @@
-from frappe.utils import flt
+from frappe.utils import flt, cint
 import frappe
 
+from neviraflow.payroll_batch import clear_payroll_batch
+
+
+## Same rule as set_daily_rate, as SQL
+DAILY_RATE_EXPRESSION = "(CASE WHEN ctc > 0 THEN ctc / 30 ELSE 0 END)"
+
+
 def set_daily_rate(doc, method=None):
     """
     Compute the employee's daily salary amount based on the employee's 
-    CTC. This is to be done before saving the employee docType
+    CTC. This is to be done before saving the employee docType.
+    Skipped when the CTC did not change and the rate is already set
     """
+    if not doc.is_new() and not doc.has_value_changed("ctc") and doc.custom_daily_salary_rate:
+        return
+
     if doc.ctc and flt(doc.ctc) > 0:
         doc.custom_daily_salary_rate = flt(doc.ctc) / 30
     else:
@@ -18,19 +29,45 @@ def validate_employee_ctc(doc, method=None):
     if doc.ctc and flt(doc.ctc) < 0:
         frappe.throw("CTC cannot be negative")
 
-def update_all_daily_rates():
+def update_all_daily_rates(company=None, dry_run=0):
     """
-    Bulk update the daily salary rate for all employees
+    Recompute the daily salary rate (CTC / 30) of all employees with one set-based UPDATE.
+    Returns a report of the rows whose rate changed with their old and new rate, and the number
+    of rows still out of line after the update (expected 0). Prefetched payroll details of the
+    changed employees are dropped so payroll runs read the new rates.
+    `bench --site <site> execute neviraflow.employee_rate.update_all_daily_rates --kwargs "{'dry_run': 1}"`
     """
-    employees = frappe.get_all("Employee", filters={"ctc": [">",0]}, 
-                               fields=["name","ctc"])
-    updated_count = 0
-    for employee in employees:
-        try:
-            daily_rate = flt(employee.ctc) / 30
-            frappe.db.set_value("Employee", employee.name, "custom_daily_salary_rate", daily_rate)
-            updated_count += 1
-        except Exception as e:
-            frappe.log_error(f"Error in updating the employee {employee.name}: {str(e)}")
+    company_condition = "AND company = %(company)s" if company else ""
+    params = {"company": company}
+
+    changes = frappe.db.sql(f"""
+                SELECT name AS employee, custom_daily_salary_rate AS old_rate, {DAILY_RATE_EXPRESSION} AS new_rate
+                FROM `tabEmployee`
+                WHERE ABS(IFNULL(custom_daily_salary_rate, 0) - {DAILY_RATE_EXPRESSION}) > 0.000001
+                {company_condition}
+                """, params, as_dict=True)
+
+    report = {"updated": 0, "changes": changes, "mismatched_after": None}
+    if cint(dry_run) or not changes:
+        print(f"{len(changes)} employees have an outdated daily salary rate")
+        return report
+
+    frappe.db.sql(f"""
+                UPDATE `tabEmployee`
+                SET custom_daily_salary_rate = {DAILY_RATE_EXPRESSION}
+                WHERE ABS(IFNULL(custom_daily_salary_rate, 0) - {DAILY_RATE_EXPRESSION}) > 0.000001
+                {company_condition}
+                """, params)
     frappe.db.commit()
-    print(f"Updated the daily salary rate for {updated_count} employees")
\ No newline at end of file
+
+    report["updated"] = len(changes)
+    report["mismatched_after"] = frappe.db.sql(f"""
+                SELECT COUNT(name)
+                FROM `tabEmployee`
+                WHERE ABS(IFNULL(custom_daily_salary_rate, 0) - {DAILY_RATE_EXPRESSION}) > 0.000001
+                {company_condition}
+                """, params)[0][0]
+
+    clear_payroll_batch([row.employee for row in changes])
+    print(f"Updated the daily salary rate for {report['updated']} employees, {report['mismatched_after']} still mismatched")
+    return report
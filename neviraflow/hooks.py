@@ -243,6 +243,17 @@ app_license = "mit"
 # }
 
 doc_events = {
+    "GL Entry": {
+        "after_insert": [
+            "neviraflow.party_balance.update_party_balance",
+            "neviraflow.party_balance.repair_party_checkpoints",
+            "neviraflow.receivables_snapshot.invalidate_receivables_snapshots",
+        ]
+    },
+    "Payment Ledger Entry": {
+        "after_insert": "neviraflow.receivables_snapshot.invalidate_receivables_snapshots",
+        "on_update": "neviraflow.receivables_snapshot.invalidate_receivables_snapshots"
+    },
     "Quotation": {
         "before_save": "neviraflow.api.assign_export_metadata"
     },
@@ -287,13 +298,47 @@ doc_events = {
         "on_submit": "neviraflow.work_order_timer.on_submit",
     },
     "Employee Checkin": {
+        "before_insert": "neviraflow.punch_dedup.mark_duplicate_punch",
         "before_save":"neviraflow.attendance_handlers.evaluate_and_infer_logtype",
         "after_insert": "neviraflow.attendance_handlers.after_insert_action",
     },
+    "Shift Assignment": {
+        "on_update": "neviraflow.shift_assignment_index.invalidate_shift_index",
+        "on_submit": "neviraflow.shift_assignment_index.invalidate_shift_index",
+        "on_update_after_submit": "neviraflow.shift_assignment_index.invalidate_shift_index",
+        "on_cancel": "neviraflow.shift_assignment_index.invalidate_shift_index",
+        "on_trash": "neviraflow.shift_assignment_index.invalidate_shift_index",
+    },
+    "Shift Type": {
+        "on_update": "neviraflow.shift_windows.invalidate_shift_windows",
+        "on_trash": "neviraflow.shift_windows.invalidate_shift_windows",
+    },
     "Employee": {
         "before_save": "neviraflow.employee_rate.set_daily_rate",
-        "validate": "neviraflow.employee_rate.validate_employee_ctc"
-
+        "validate": "neviraflow.employee_rate.validate_employee_ctc",
+        "on_update": [
+            "neviraflow.checkin_ingest.clear_device_user_map",
+            "neviraflow.payroll_batch.clear_employee_payroll_batch",
+            "neviraflow.attendance_ratio.clear_employee_attendance_ratio",
+            "neviraflow.payroll_attendance_matrix.invalidate_employee_matrix",
+        ]
+    },
+    "Attendance": {
+        "on_submit": [
+            "neviraflow.payroll_attendance_matrix.invalidate_attendance_matrix",
+            "neviraflow.attendance_ratio.invalidate_attendance_ratio",
+        ],
+        "on_cancel": [
+            "neviraflow.payroll_attendance_matrix.invalidate_attendance_matrix",
+            "neviraflow.attendance_ratio.invalidate_attendance_ratio",
+        ],
+    },
+    "Holiday List": {
+        "on_update": "neviraflow.payroll_attendance_matrix.invalidate_holiday_matrix",
+        "on_trash": "neviraflow.payroll_attendance_matrix.invalidate_holiday_matrix",
+    },
+    "Payroll Entry": {
+        "before_submit": "neviraflow.payroll_batch.prefetch_payroll_entry"
     },
     "Salary Structure Assignment":{
         "before_save": "neviraflow.prorated_and_absent_salary_computations.before_submit_salary_structure_assignment"
@@ -340,4 +385,13 @@ scheduler_events = {
         "*/5 * * * *": ["frappe.email.queue.flush"],
         #"0 10 * * *" : ["neviraflow.attendance_absentee_job.mark_absentees"]
     },
+    "hourly": [
+        "neviraflow.credit_limit_check.refresh_credit_snapshot",
+    ],
+    "daily": [
+        "neviraflow.attendance_metrics.compute_previous_day_metrics",
+        "neviraflow.party_balance.reconcile_party_balances",
+        "neviraflow.party_balance.reconcile_party_checkpoints",
+        "neviraflow.party_balance.build_party_balance_checkpoints",
+    ],
 }
@@ -1,8 +1,85 @@
 // Copyright (c) 2025, Victor Mandela, Billy Adwar & Moses Njue and contributors
 // For license information, please see license.txt
 
-// frappe.ui.form.on("Consolidated Customer Receivables", {
-// 	refresh(frm) {
+const STATEMENT_PAGE_LENGTH = 100;
 
-// 	},
-// });
+frappe.ui.form.on("Consolidated Customer Receivables", {
+    refresh: function(frm){
+        // Summary only statements load their lines page by page instead of from the child tables
+        let wrapper = frm.get_field("statement_lines_html").$wrapper;
+        wrapper.empty();
+        if(!frm.doc.summary_only || frm.is_new()){
+            return;
+        }
+
+        wrapper.html(`
+            <div class="statement-ledger"></div>
+            <div class="statement-invoices" style="margin-top: 20px;"></div>
+        `);
+        frm.events.load_statement_page(frm, "all_transactions", 0);
+        frm.events.load_statement_page(frm, "unpaid_invoices", 0);
+    },
+
+    load_statement_page: function(frm, table, start){
+        frappe.call({
+            method: "neviraflow.nevira_workflow.doctype.consolidated_customer_receivables.consolidated_customer_receivables.get_statement_page",
+            args: {
+                name: frm.doc.name,
+                table: table,
+                start: start,
+                page_length: STATEMENT_PAGE_LENGTH
+            },
+            callback: function(r){
+                if(r.message){
+                    frm.events.render_statement_page(frm, table, r.message);
+                }
+            }
+        });
+    },
+
+    render_statement_page: function(frm, table, page){
+        let is_ledger = table === "all_transactions";
+        let columns = is_ledger
+            ? [["posting_date", __("Posting Date")], ["voucher_type", __("Voucher Type")], ["voucher_no", __("Voucher No")],
+               ["cheque_reference_no", __("Cheque Reference")], ["debit", __("Debit")], ["credit", __("Credit")], ["balance", __("Balance")]]
+            : [["posting_date", __("Posting Date")], ["voucher_type", __("Voucher Type")], ["voucher_no", __("Voucher No")],
+               ["due_date", __("Due Date")], ["invoiced", __("Invoiced")], ["paid", __("Paid")], ["outstanding", __("Outstanding")]];
+        let currency_fields = ["debit", "credit", "balance", "invoiced", "paid", "outstanding"];
+
+        let header = columns.map(c => `<th>${c[1]}</th>`).join("");
+        let body = page.rows.map(row => "<tr>" + columns.map(c => {
+            let value = row[c[0]];
+            if(currency_fields.includes(c[0])){
+                value = format_currency(value);
+            } else if(c[0].endsWith("_date")){
+                value = value ? frappe.datetime.str_to_user(value) : "";
+            }
+            return `<td>${frappe.utils.escape_html(String(value ?? ""))}</td>`;
+        }).join("") + "</tr>").join("");
+
+        let end = Math.min(page.start + page.rows.length, page.total);
+        let title = is_ledger ? __("Ledger Lines") : __("Unpaid Invoices");
+        let wrapper = frm.get_field("statement_lines_html").$wrapper.find(is_ledger ? ".statement-ledger" : ".statement-invoices");
+        wrapper.html(`
+            <h5>${title}</h5>
+            <table class="table table-bordered table-condensed">
+                <thead><tr>${header}</tr></thead>
+                <tbody>${body}</tbody>
+            </table>
+            <div class="flex justify-between align-center">
+                <span class="text-muted">${__("{0} to {1} of {2}", [page.total ? page.start + 1 : 0, end, page.total])}</span>
+                <span>
+                    <button class="btn btn-xs btn-default btn-prev" ${page.start > 0 ? "" : "disabled"}>${__("Previous")}</button>
+                    <button class="btn btn-xs btn-default btn-next" ${end < page.total ? "" : "disabled"}>${__("Next")}</button>
+                </span>
+            </div>
+        `);
+
+        wrapper.find(".btn-prev").on("click", () => {
+            frm.events.load_statement_page(frm, table, Math.max(page.start - STATEMENT_PAGE_LENGTH, 0));
+        });
+        wrapper.find(".btn-next").on("click", () => {
+            frm.events.load_statement_page(frm, table, page.start + STATEMENT_PAGE_LENGTH);
+        });
+    }
+});
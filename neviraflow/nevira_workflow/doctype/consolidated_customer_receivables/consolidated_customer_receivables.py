@@ -4,12 +4,16 @@
 import frappe
 from frappe import _
 from frappe.model.document import Document
-from erpnext.accounts.report.accounts_receivable.accounts_receivable import execute as ar_execute
-from erpnext.accounts.report.accounts_receivable_summary.accounts_receivable_summary import execute as ar_summary_execute
-from erpnext.accounts.report.general_ledger.general_ledger import execute as gl_execute
-from frappe.utils import add_days, today, getdate, flt
+from frappe.utils import add_days, today, getdate, flt, cint
 from erpnext.accounts.party import get_due_date, get_party_account, get_party_details
 
+from neviraflow.party_balance import get_party_balance, get_party_balance_on
+from neviraflow.receivables_engine import (
+    get_ledger_lines, get_ledger_page, get_open_invoices, get_receivables_summary, parse_ageing_ranges,
+    count_outstanding_vouchers
+)
+from neviraflow.receivables_snapshot import get_receivables_snapshot, set_receivables_snapshot
+
 
 class ConsolidatedCustomerReceivables(Document):
     def validate(self):
@@ -18,25 +22,68 @@ class ConsolidatedCustomerReceivables(Document):
         and fetching before data is saved
         """
         self.validate_dates()
+        #### The open invoices and ageing are as of the day the statement is built, paging reuses the date
+        self.report_date = getdate()
 
         #### Clear the tables first
         self.set("all_transactions",[])
         self.set("unpaid_invoices",[])
         self.set("ageing_summary",[])
 
+        #### Summary only: the lines are served page by page through get_statement_page
+        if self.summary_only:
+            self.set_summary_figures()
+            self.fetch_accounts_receivable_summary()
+            return
+
+        #### Reuse the tables built for the same customer and period if nothing was posted since
+        report_date = self.report_date
+        snapshot = get_receivables_snapshot(self.company, self.customer, self.from_date, self.to_date, report_date,
+                                            self.get_ageing_ranges())
+        if snapshot:
+            for table, rows in snapshot.items():
+                self.set(table, rows)
+            return
 
         #### Populate the tables here
         self.fetch_general_ledger_transactions()
         self.fetch_accounts_receivable_data()
         self.fetch_accounts_receivable_summary()
 
+        set_receivables_snapshot(self.company, self.customer, self.from_date, self.to_date, report_date, self,
+                                 self.get_ageing_ranges())
+
     def before_save(self):
-        customer_name, email_id, phone_number = frappe.db.get_value('Customer', self.customer,['customer_name','email_id','mobile_no'])
+        #### Statement runs prefetch the customer details and balances of a whole chunk of customers
+        details = self.flags.customer_details
+        if details:
+            customer_name, email_id, phone_number = details.customer_name, details.email_id, details.mobile_no
+        else:
+            customer_name, email_id, phone_number = frappe.db.get_value('Customer', self.customer,['customer_name','email_id','mobile_no'])
         self.email_id = email_id
         self.phone_number = phone_number
         self.customer_name = customer_name
         
-        self.total_outstanding_amount = self.get_customer_balance()
+        if self.flags.customer_balance is not None:
+            self.total_outstanding_amount = self.flags.customer_balance
+        else:
+            self.total_outstanding_amount = self.get_customer_balance()
+
+    def set_summary_figures(self):
+        """
+        Opening and closing balances of the period from the party balance checkpoints
+        """
+        self.opening_balance = get_party_balance_on(self.customer, add_days(self.from_date, -1), "Customer", self.company)
+        self.closing_balance = get_party_balance_on(self.customer, self.to_date, "Customer", self.company)
+
+    def get_ageing_ranges(self):
+        """
+        The ageing ranges of the statement, the child tables have five range columns
+        """
+        ranges = parse_ageing_ranges(self.ageing_ranges)
+        if len(ranges) > 4:
+            frappe.throw("At most four ageing ranges can be set")
+        return ranges
 
     def validate_dates(self):
         if self.to_date and self.from_date:
@@ -47,46 +94,28 @@ class ConsolidatedCustomerReceivables(Document):
         """
         Fetch the general ledger transactions based on the selected from date and to date
         """
-        filters = {
-            "company": self.company,
-            "from_date": self.from_date,
-            "to_date": self.to_date,
-            "party_type": "Customer",
-            "party": [self.customer],
-            "group_by": "Group by Voucher (Consolidated)",
-            "show_opening_entries": 1
-        }
-       
-        filters_  = frappe._dict(filters)
-
         ## Clear the child table first before populating it with data
         self.all_customer_transactions = []
 
-        ## From the execution of the report we only want to get the data and not the columns
         try:
-            gl_data = gl_execute(filters_)
-            if gl_data and len(gl_data) > 1:
-
-                all_transactions_list = gl_data[1]
-
-                for row in all_transactions_list:
-                    cheque_ref = ""
-                    if row.get("voucher_type") == "Payment Entry":
-                        pe_number = row.get("voucher_no")
-                        cheque_ref += frappe.db.get_value("Payment Entry",pe_number, "reference_no")
-                        currency = frappe.db.get_value("Account",row.get("account"),"account_currency")
-
-                    self.append("all_transactions",{
-                        "posting_date":row.get("posting_date"),
-                        "account": row.get("account"),
-                        "voucher_type":row.get("voucher_type"),
-                        "voucher_no":row.get("voucher_no"),
-                        "cheque_reference_no": cheque_ref,
-                        "debit": flt(row.get("debit")),
-                        "credit": flt(row.get("credit")),
-                        "balance":flt(row.get("balance")),
-                        "account_currency":"KES"
-                    })
+            ## Statement runs prefetch the ledger lines of a whole chunk of customers
+            all_transactions_list = self.flags.ledger_lines
+            if all_transactions_list is None:
+                all_transactions_list = get_ledger_lines(self.company, self.customer, self.from_date, self.to_date)
+
+            ## Cheque references and account currencies come resolved in bulk with the lines
+            for row in all_transactions_list:
+                self.append("all_transactions",{
+                    "posting_date":row.get("posting_date"),
+                    "account": row.get("account"),
+                    "voucher_type":row.get("voucher_type"),
+                    "voucher_no":row.get("voucher_no"),
+                    "cheque_reference_no": row.get("cheque_reference_no"),
+                    "debit": flt(row.get("debit")),
+                    "credit": flt(row.get("credit")),
+                    "balance":flt(row.get("balance")),
+                    "account_currency": row.get("account_currency") or "KES"
+                })
         except Exception as e:
             frappe.log_error(f"Error encountered in fetching and populating general ledger data: {str(e)}")
             frappe.msgprint(f"Error loading GL Data {str(e)}")
@@ -95,45 +124,32 @@ class ConsolidatedCustomerReceivables(Document):
 
     def fetch_accounts_receivable_data(self):
         """
-        Fetches data frm the accounts receivable report
+        Fetches the open invoices with their ageing as of the report date
         """
-        filters = {
-            "company": self.company,
-            "report_date": getdate(),
-            "party_type": "Customer",
-            "party": [self.customer],
-            "ageing_based_on": "Due Date",
-            "range": "30, 60, 90, 120",
-            "calculate_ageing_with": "Today Date"
-        }
-        
-
-        filters_  = frappe._dict(filters)
-        
         ### Before populating the child table with data, first clear the child table
         self.unpaid_invoices = []
         
         try:
-            receivables_data = ar_execute(filters_)
-            if receivables_data:
-                receivables_list = receivables_data[1]
-                if len(receivables_list) > 0:
-                    for row in receivables_list:
-                        self.append("unpaid_invoices",{
-                            "posting_date": row.get("posting_date"),
-                            "voucher_type": row.get("voucher_type"),
-                            "voucher_no": row.get("voucher_no"),
-                            "due_date": row.get("due_date") if row.get("due_date") else "",
-                            "invoiced_amount": flt(row.get("invoice_grand_total")),
-                            "credit_note": flt(row.get("credit_note")),
-                            "paid_amount": flt(row.get("paid")),
-                            "range1": flt(row.get("range1")),
-                            "range2": flt(row.get("range2")),
-                            "range3": flt(row.get("range3")),
-                            "range4": flt(row.get("range4")),
-                            "range5": flt(row.get("range5")),
-                            "outstanding_amount": flt(row.get("outstanding"))
-                        })
+            receivables_list = self.flags.open_invoices
+            if receivables_list is None:
+                receivables_list = get_open_invoices(self.company, self.customer, self.report_date, self.get_ageing_ranges())
+            self.flags.open_invoices = receivables_list
+            for row in receivables_list:
+                self.append("unpaid_invoices",{
+                    "posting_date": row.get("posting_date"),
+                    "voucher_type": row.get("voucher_type"),
+                    "voucher_no": row.get("voucher_no"),
+                    "due_date": row.get("due_date") if row.get("due_date") else "",
+                    "invoiced_amount": flt(row.get("invoice_grand_total")),
+                    "credit_note": flt(row.get("credit_note")),
+                    "paid_amount": flt(row.get("paid")),
+                    "range1": flt(row.get("range1")),
+                    "range2": flt(row.get("range2")),
+                    "range3": flt(row.get("range3")),
+                    "range4": flt(row.get("range4")),
+                    "range5": flt(row.get("range5")),
+                    "outstanding_amount": flt(row.get("outstanding"))
+                })
         except Exception as e:
             frappe.log_error(f"Error in fetching the accounts receivables data {str(e)}")
             frappe.msgprint(f"Error encountered in fetching accounts receivable data: {str(e)}")
@@ -141,68 +157,62 @@ class ConsolidatedCustomerReceivables(Document):
 
     def fetch_accounts_receivable_summary(self):
         """
-        Get the summarised data from the accounts receivable summary and populate the child table
+        Summarise the open invoices and populate the child table
         """
-        filters = {
-            "company": self.company,
-            "report_date": getdate(),
-            "party_type": "Customer",
-            "party":[self.customer],
-            "ageing_based_on": "Due Date",
-            "range": "30, 60, 90, 120",
-            "calculate_ageing_with": "Today Date"
-        }
-        filters_ = frappe._dict(filters)
-
         ### Before populating the child table with data, first clear the child table
         self.ageing_summary = []
 
         try:
-            ar_summary_data = ar_summary_execute(filters_)
-
-            if ar_summary_data:
-                ar_summary_list = ar_summary_data[1]
-
-                if len(ar_summary_list) > 0:
-                    for row in ar_summary_list:
-                        self.append("ageing_summary",{
-                            "customer_name": row.get("party_name"),
-                            "invoiced_amount": flt(row.get("invoiced_amount")),
-                            "paid_amount": flt(row.get("paid_amount")),
-                            "credit_note": flt(row.get("credit_note")),
-                            "outstanding_amount": flt(row.get("outstanding")),
-                            "range1": flt(row.get("range1")),
-                            "range2": flt(row.get("range2")),
-                            "range3": flt(row.get("range3")),
-                            "range4": flt(row.get("range4")),
-                            "range5": flt(row.get("range5")),
-                            "total_amount_due": flt(row.get("total_due"))
-                        })
+            open_invoices = self.flags.open_invoices
+            if open_invoices is None:
+                open_invoices = get_open_invoices(self.company, self.customer, self.report_date, self.get_ageing_ranges())
+
+            if open_invoices:
+                customer_name = self.customer_name or frappe.db.get_value("Customer", self.customer, "customer_name")
+                row = get_receivables_summary(customer_name, open_invoices, self.get_ageing_ranges())
+                self.append("ageing_summary",{
+                    "customer_name": row.get("party_name"),
+                    "invoiced_amount": flt(row.get("invoiced_amount")),
+                    "paid_amount": flt(row.get("paid_amount")),
+                    "credit_note": flt(row.get("credit_note")),
+                    "outstanding_amount": flt(row.get("outstanding")),
+                    "range1": flt(row.get("range1")),
+                    "range2": flt(row.get("range2")),
+                    "range3": flt(row.get("range3")),
+                    "range4": flt(row.get("range4")),
+                    "range5": flt(row.get("range5")),
+                    "total_amount_due": flt(row.get("total_due"))
+                })
 
         except Exception as e:
             frappe.log_error(f" Failed to fetch the accounts receivable summary {str(e)}")
             frappe.msgprint(f" Failed to fetch and populate the acconts receivable summary {str(e)}")
 
             
-    ## Get the customer's balance from the ledger 
+    ## Get the customer's balance from the maintained party balance
     def get_customer_balance(self):
-        customer_id = self.customer
-        balance_query = frappe.db.sql(""" SELECT (SUM(debit) - SUM(credit)) AS balance 
-                FROM `tabGL Entry` WHERE party = %s""",
-                (customer_id), as_dict=True) 
-        if balance_query:
-            balance = balance_query[0]["balance"]
-            return balance
-        else:
-            return 0.00
+        return get_balance(self.customer)
 
 def get_balance(customer):
-    balance_query = frappe.db.sql(""" SELECT (SUM(debit) - SUM(credit)) AS balance 
-                FROM `tabGL Entry` WHERE party = %s""",
-                (customer), as_dict=True) 
-    if balance_query:
-        balance = balance_query[0]["balance"]
-        return balance
-    else:
-        return 0.00
-    
\ No newline at end of file
+    return get_party_balance(customer, "Customer")
+
+
+@frappe.whitelist()
+def get_statement_page(name, table="all_transactions", start=0, page_length=100):
+    """
+    One page of a statement's ledger lines or open invoices, for documents saved in summary only mode
+    """
+    doc = frappe.get_doc("Consolidated Customer Receivables", name)
+    doc.check_permission("read")
+    start, page_length = max(cint(start), 0), min(max(cint(page_length), 1), 500)
+
+    if table == "all_transactions":
+        return get_ledger_page(doc.company, doc.customer, doc.from_date, doc.to_date, start, page_length)
+
+    ## Paged in SQL as of the date the statement was built
+    report_date = doc.report_date or getdate(doc.modified)
+    return {
+        "total": count_outstanding_vouchers(doc.company, report_date, [doc.customer]),
+        "start": start,
+        "rows": get_open_invoices(doc.company, doc.customer, report_date, doc.get_ageing_ranges(), start, page_length)
+    }
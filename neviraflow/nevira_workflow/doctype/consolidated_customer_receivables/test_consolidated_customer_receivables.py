@@ -1,9 +1,112 @@
 # Copyright (c) 2025, Victor Mandela, Billy Adwar & Moses Njue and Contributors
 # See license.txt
 
-# import frappe
+import frappe
 from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, flt, getdate
+from erpnext.accounts.doctype.payment_entry.payment_entry import get_payment_entry
+from erpnext.accounts.doctype.sales_invoice.test_sales_invoice import create_sales_invoice
+from erpnext.accounts.report.accounts_receivable.accounts_receivable import execute as ar_execute
+from erpnext.accounts.report.accounts_receivable_summary.accounts_receivable_summary import execute as ar_summary_execute
+from erpnext.accounts.report.general_ledger.general_ledger import execute as gl_execute
+
+from neviraflow.receivables_engine import get_ledger_lines, get_open_invoices, get_receivables_summary
+
+
+TEST_COMPANY = "_Test Company"
+TEST_CUSTOMER = "_Test Receivables Parity Customer"
 
 
 class TestConsolidatedCustomerReceivables(FrappeTestCase):
-	pass
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		if not frappe.db.exists("Customer", TEST_CUSTOMER):
+			frappe.get_doc({
+				"doctype": "Customer",
+				"customer_name": TEST_CUSTOMER,
+				"customer_group": "_Test Customer Group",
+				"territory": "_Test Territory"
+			}).insert()
+
+		today = getdate()
+		cls.from_date = add_days(today, -60)
+		cls.to_date = today
+
+		## Opening invoice before the period, an aged invoice partly paid by cheque, a current invoice
+		## with a credit note against it and a standalone credit note partly refunded
+		create_sales_invoice(customer=TEST_CUSTOMER, posting_date=add_days(today, -100), set_posting_time=1, rate=500)
+		aged = create_sales_invoice(customer=TEST_CUSTOMER, posting_date=add_days(today, -45), set_posting_time=1, rate=1000)
+		current = create_sales_invoice(customer=TEST_CUSTOMER, posting_date=add_days(today, -5), set_posting_time=1, rate=300)
+		create_sales_invoice(customer=TEST_CUSTOMER, posting_date=add_days(today, -3), set_posting_time=1,
+							 is_return=1, return_against=current.name, qty=-1, rate=100)
+		credit_note = create_sales_invoice(customer=TEST_CUSTOMER, posting_date=add_days(today, -20), set_posting_time=1,
+										   is_return=1, qty=-1, rate=200)
+
+		payment = get_payment_entry("Sales Invoice", aged.name, bank_account="_Test Bank - _TC")
+		payment.posting_date = add_days(today, -10)
+		payment.reference_no = "CHQ-PARITY-1"
+		payment.reference_date = payment.posting_date
+		payment.paid_amount = payment.received_amount = 400
+		payment.references[0].allocated_amount = 400
+		payment.insert()
+		payment.submit()
+
+		refund = get_payment_entry("Sales Invoice", credit_note.name, bank_account="_Test Bank - _TC")
+		refund.posting_date = add_days(today, -2)
+		refund.reference_no = "CHQ-PARITY-2"
+		refund.reference_date = refund.posting_date
+		refund.paid_amount = refund.received_amount = 50
+		refund.references[0].allocated_amount = -50
+		refund.insert()
+		refund.submit()
+
+	def test_ledger_lines_match_general_ledger(self):
+		filters = frappe._dict({
+			"company": TEST_COMPANY,
+			"from_date": self.from_date,
+			"to_date": self.to_date,
+			"party_type": "Customer",
+			"party": [TEST_CUSTOMER],
+			"group_by": "Group by Voucher (Consolidated)",
+			"show_opening_entries": 1
+		})
+		expected = [row for row in gl_execute(filters)[1] if row.get("account")]
+		lines = get_ledger_lines(TEST_COMPANY, TEST_CUSTOMER, self.from_date, self.to_date)
+
+		self.assertEqual(len(lines), len(expected))
+		for line, row in zip(lines, expected):
+			self.assertEqual(line.get("voucher_no"), row.get("voucher_no"))
+			self.assertAlmostEqual(flt(line.debit), flt(row.get("debit")), places=2)
+			self.assertAlmostEqual(flt(line.credit), flt(row.get("credit")), places=2)
+			self.assertAlmostEqual(flt(line.balance), flt(row.get("balance")), places=2)
+
+	def test_open_invoices_match_accounts_receivable(self):
+		filters = frappe._dict({
+			"company": TEST_COMPANY,
+			"report_date": getdate(),
+			"party_type": "Customer",
+			"party": [TEST_CUSTOMER],
+			"ageing_based_on": "Due Date",
+			"range": "30, 60, 90, 120",
+			"calculate_ageing_with": "Today Date"
+		})
+		expected = {row.get("voucher_no"): row for row in ar_execute(filters)[1]}
+		rows = get_open_invoices(TEST_COMPANY, TEST_CUSTOMER, getdate())
+
+		self.assertEqual({row.voucher_no for row in rows}, set(expected))
+		for row in rows:
+			report_row = expected[row.voucher_no]
+			self.assertAlmostEqual(row.outstanding, flt(report_row.get("outstanding")), places=2)
+			self.assertAlmostEqual(row.invoiced, flt(report_row.get("invoiced")), places=2)
+			self.assertAlmostEqual(row.invoice_grand_total, flt(report_row.get("invoice_grand_total")), places=2)
+			self.assertAlmostEqual(row.paid, flt(report_row.get("paid")), places=2)
+			self.assertAlmostEqual(row.credit_note, flt(report_row.get("credit_note")), places=2)
+			for index in range(1, 6):
+				self.assertAlmostEqual(row[f"range{index}"], flt(report_row.get(f"range{index}")), places=2)
+
+		summary = get_receivables_summary(TEST_CUSTOMER, rows)
+		report_summary = ar_summary_execute(filters)[1][0]
+		self.assertAlmostEqual(summary.outstanding, flt(report_summary.get("outstanding")), places=2)
+		for index in range(1, 6):
+			self.assertAlmostEqual(summary[f"range{index}"], flt(report_summary.get(f"range{index}")), places=2)
@@ -0,0 +1,9 @@
+# Copyright (c) 2026, Victor Mandela, Billy Adwar & Moses Njue and contributors
+# For license information, please see license.txt
+
+# import frappe
+from frappe.model.document import Document
+
+
+class CustomerCreditSnapshot(Document):
+	pass
@@ -0,0 +1,33 @@
+// Copyright (c) 2026, Victor Mandela, Billy Adwar & Moses Njue and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on("Customer Statement Run", {
+    onload: function(frm){
+        // Progress of the statement chunks running in the background
+        frappe.realtime.off("customer_statement_run_progress");
+        frappe.realtime.on("customer_statement_run_progress", function(data){
+            let total = data.completed + data.failed + data.pending;
+            frm.dashboard.show_progress(__("Generating Statements"),
+                (data.completed + data.failed) / total * 100,
+                __("{0} completed, {1} failed of {2}", [data.completed, data.failed, total]));
+            if(!data.pending){
+                frm.dashboard.hide_progress();
+                frm.reload_doc();
+            }
+        });
+    },
+
+    refresh: function(frm){
+        if(frm.doc.docstatus === 0){
+            frm.add_custom_button(__("Get Customers"), function(){
+                if(!frm.doc.company){
+                    frappe.msgprint(__("Please select the company first"));
+                    return;
+                }
+                frm.call('get_customers').then(() => {
+                    frm.refresh_field('customers');
+                });
+            });
+        }
+    }
+});
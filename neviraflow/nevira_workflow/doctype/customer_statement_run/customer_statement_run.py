@@ -0,0 +1,172 @@
+# Copyright (c) 2026, Victor Mandela, Billy Adwar & Moses Njue and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.model.document import Document
+from frappe.utils import getdate
+
+from neviraflow.receivables_engine import get_customers_ledger_lines, get_customers_open_invoices, DEFAULT_AGEING_RANGES
+
+
+STATEMENT_CHUNK_SIZE = 25
+STATEMENT_RUN_EVENT = "customer_statement_run_progress"
+
+
+class CustomerStatementRun(Document):
+	def validate(self):
+		if getdate(self.from_date) > getdate(self.to_date):
+			frappe.throw(_("From Date cannot be after To Date"))
+
+	def before_submit(self):
+		if not self.customers:
+			frappe.throw(_("Add the customers to generate statements for, or use Get Customers"))
+
+		self.status = "Queued"
+		self.total_customers = len(self.customers)
+		self.completed_customers = 0
+		self.failed_customers = 0
+
+	def on_submit(self):
+		"""
+		Fan the statements out over the long queue workers in chunks, each chunk is an independent job
+		"""
+		rows = [row.name for row in self.customers]
+		for start in range(0, len(rows), STATEMENT_CHUNK_SIZE):
+			frappe.enqueue(
+				"neviraflow.nevira_workflow.doctype.customer_statement_run.customer_statement_run.build_statement_chunk",
+				queue="long",
+				timeout=3600,
+				enqueue_after_commit=True,
+				run_name=self.name,
+				item_names=rows[start:start + STATEMENT_CHUNK_SIZE],
+			)
+		frappe.msgprint(_("{0} statements have been queued").format(len(rows)))
+
+	@frappe.whitelist()
+	def get_customers(self):
+		"""
+		Fill the customers table from the customer group and credit limit filters
+		"""
+		conditions = ["c.disabled = 0"]
+		if self.customer_group:
+			lft, rgt = frappe.db.get_value("Customer Group", self.customer_group, ["lft", "rgt"])
+			conditions.append(f"c.customer_group IN (SELECT name FROM `tabCustomer Group` WHERE lft >= {lft} AND rgt <= {rgt})")
+		if self.only_credit_customers:
+			conditions.append("""EXISTS (SELECT 1 FROM `tabCustomer Credit Limit` ccl
+						WHERE ccl.parent = c.name AND ccl.parenttype = 'Customer' AND ccl.credit_limit > 0)""")
+
+		customers = frappe.db.sql(f"""
+					SELECT c.name, c.customer_name
+					FROM `tabCustomer` c
+					WHERE {" AND ".join(conditions)}
+					ORDER BY c.name
+					""", as_dict=True)
+
+		self.customers = []
+		for customer in customers:
+			self.append("customers", {"customer": customer.name, "customer_name": customer.customer_name})
+
+		frappe.msgprint(_("Added {0} customers").format(len(customers)))
+		return len(customers)
+
+
+def build_statement_chunk(run_name, item_names):
+	"""
+	Build, render and attach the statements of one chunk of customers.
+	Customer details, party balances, ledger lines and open invoices of the whole chunk are prefetched
+	with a few queries for all of them and sliced per customer,
+	every customer is committed on its own so one failure does not hold back the rest
+	"""
+	run = frappe.get_doc("Customer Statement Run", run_name)
+	items = [row for row in run.customers if row.name in set(item_names) and row.status != "Completed"]
+	if not items:
+		return
+
+	customers = [row.customer for row in items]
+	details = {
+		row.name: row
+		for row in frappe.get_all("Customer",
+								  filters={"name": ["in", customers]},
+								  fields=["name", "customer_name", "email_id", "mobile_no"])
+	}
+	balances = dict(frappe.db.sql("""
+				SELECT party, SUM(balance)
+				FROM `tabParty Balance`
+				WHERE party_type = 'Customer' AND party IN %s
+				GROUP BY party
+				""", (tuple(customers),)))
+	ledger_lines = get_customers_ledger_lines(run.company, customers, run.from_date, run.to_date)
+	open_invoices = get_customers_open_invoices(run.company, customers, getdate(), DEFAULT_AGEING_RANGES)
+
+	for row in items:
+		try:
+			statement = frappe.new_doc("Consolidated Customer Receivables")
+			statement.update({
+				"company": run.company,
+				"customer": row.customer,
+				"from_date": run.from_date,
+				"to_date": run.to_date
+			})
+			statement.flags.customer_details = details.get(row.customer)
+			statement.flags.customer_balance = balances.get(row.customer, 0)
+			statement.flags.ledger_lines = ledger_lines.get(row.customer)
+			statement.flags.open_invoices = open_invoices.get(row.customer, [])
+			statement.insert(ignore_permissions=True)
+
+			pdf = frappe.get_print(statement.doctype, statement.name, as_pdf=True)
+			pdf_file = frappe.get_doc({
+				"doctype": "File",
+				"file_name": f"Statement-{row.customer}-{run.to_date}.pdf",
+				"attached_to_doctype": statement.doctype,
+				"attached_to_name": statement.name,
+				"is_private": 1,
+				"content": pdf
+			}).insert(ignore_permissions=True)
+
+			frappe.db.set_value("Customer Statement Run Item", row.name, {
+				"status": "Completed",
+				"statement": statement.name,
+				"statement_pdf": pdf_file.file_url,
+				"error": None
+			})
+			frappe.db.commit()
+		except Exception:
+			frappe.db.rollback()
+			frappe.log_error(frappe.get_traceback(), f"Customer statement failed for {row.customer}")
+			frappe.db.set_value("Customer Statement Run Item", row.name, {
+				"status": "Failed",
+				"error": frappe.get_traceback()[-1000:]
+			})
+			frappe.db.commit()
+
+	update_run_progress(run_name)
+
+
+def update_run_progress(run_name):
+	"""
+	Recount the run's customers by status, chunks finish in any order so the counts are derived, not incremented
+	"""
+	counts = dict(frappe.db.sql("""
+				SELECT status, COUNT(name)
+				FROM `tabCustomer Statement Run Item`
+				WHERE parent = %s AND parenttype = 'Customer Statement Run'
+				GROUP BY status
+				""", run_name))
+
+	completed, failed, pending = counts.get("Completed", 0), counts.get("Failed", 0), counts.get("Pending", 0)
+	if pending:
+		status = "In Progress"
+	else:
+		status = "Completed With Errors" if failed else "Completed"
+
+	frappe.db.set_value("Customer Statement Run", run_name, {
+		"completed_customers": completed,
+		"failed_customers": failed,
+		"status": status
+	})
+	frappe.db.commit()
+
+	frappe.publish_realtime(STATEMENT_RUN_EVENT,
+							{"completed": completed, "failed": failed, "pending": pending, "status": status},
+							doctype="Customer Statement Run", docname=run_name)
@@ -0,0 +1,9 @@
+# Copyright (c) 2026, Victor Mandela, Billy Adwar & Moses Njue and Contributors
+# See license.txt
+
+# import frappe
+from frappe.tests.utils import FrappeTestCase
+
+
+class TestCustomerStatementRun(FrappeTestCase):
+	pass
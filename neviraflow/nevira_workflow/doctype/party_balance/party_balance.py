@@ -0,0 +1,12 @@
+# Copyright (c) 2026, Victor Mandela, Billy Adwar & Moses Njue and contributors
+# For license information, please see license.txt
+
+# import frappe
+from frappe.model.document import Document
+
+from neviraflow.party_balance import get_party_balance_name
+
+
+class PartyBalance(Document):
+	def autoname(self):
+		self.name = get_party_balance_name(self.company, self.party_type, self.party)
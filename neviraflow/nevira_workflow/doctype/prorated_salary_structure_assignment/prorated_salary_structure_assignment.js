@@ -2,6 +2,25 @@
 // For license information, please see license.txt
 
 frappe.ui.form.on("Prorated Salary Structure Assignment", {
+    onload: function(frm){
+        // Progress of the background creation of the assignments
+        frappe.realtime.off("prorated_ssa_progress");
+        frappe.realtime.on("prorated_ssa_progress", function(data){
+            if(data.done){
+                frm.dashboard.hide_progress();
+                frappe.show_alert({
+                    message: __("Created {0}, skipped {1}, failed {2} Salary Structure Assignments", [data.created, data.skipped, data.failed]),
+                    indicator: data.failed ? "orange" : "green"
+                });
+                frm.reload_doc();
+                return;
+            }
+            frm.dashboard.show_progress(__("Creating Salary Structure Assignments"),
+                data.processed / data.total * 100,
+                __("{0} of {1}", [data.processed, data.total]));
+        });
+    },
+
     refresh: function(frm){
         // Add custom button to get the employees
         frm.add_custom_button(__("Get Employees"), function(){
@@ -4,7 +4,11 @@
 import frappe
 from frappe import _
 from frappe.model.document import Document
-from frappe.utils import add_days
+from frappe.utils import add_days, getdate
+
+
+SSA_CHUNK_SIZE = 50
+SSA_PROGRESS_EVENT = "prorated_ssa_progress"
 
 
 class ProratedSalaryStructureAssignment(Document):
@@ -12,7 +16,14 @@ class ProratedSalaryStructureAssignment(Document):
 		self.set_payroll_payable_account()
 
 	def on_submit(self):
-		self.create_salary_structure_assignments()
+		frappe.enqueue(
+			"neviraflow.nevira_workflow.doctype.prorated_salary_structure_assignment.prorated_salary_structure_assignment.create_salary_structure_assignments",
+			queue="long",
+			timeout=3600,
+			enqueue_after_commit=True,
+			docname=self.name,
+		)
+		frappe.msgprint(_("Salary Structure Assignments are being created in the background"))
 
 	@frappe.whitelist(allow_guest=True)
 	def get_employees_based_on_dates(self):
@@ -68,61 +79,94 @@ class ProratedSalaryStructureAssignment(Document):
 				)
 
 	
-	def create_salary_structure_assignments(self):
-		"""
-		Create a salary structure assignment for each of the employees in the table
-		"""
-		assignments_created = []
-		
+	@frappe.whitelist(allow_guest=True)
+	def get_created_assignments(self):
+		"""Get a list of created salary structure assignments"""
+		assignments = []
 		for employee_row in self.prorated_employees:
-			## Check for any existing salary structures in the current month
-			existing_assignments = frappe.db.exists(
-				"Salary Structure Assignment",{
-					"employee": employee_row.employee,
-					"salary_structure": self.salary_structure,
-					"from_date": employee_row.joining_date,
-					"docstatus": 1
-				}
-			)
-			if existing_assignments:
-				frappe.msgprint(f"Salary assignment already exists for employee {employee_row.employee_name}")
+			if employee_row.name:
+				assignments.append(employee_row.name)
+		return assignments
+
+
+def create_salary_structure_assignments(docname):
+	"""
+	Create a salary structure assignment for each of the employees in the table, in chunks.
+	Existing assignments and the employees' details are loaded once up front, progress is pushed to the form
+	"""
+	doc = frappe.get_doc("Prorated Salary Structure Assignment", docname)
+	rows = [row for row in doc.prorated_employees if row.employee and not row.salary_structure_assignment]
+
+	existing = get_existing_assignments(doc.salary_structure, [row.employee for row in rows])
+	employees = {
+		emp.name: emp
+		for emp in frappe.get_all(
+			"Employee",
+			filters={"name": ["in", [row.employee for row in rows] or [""]]},
+			fields=["name", "ctc", "custom_daily_salary_rate", "date_of_joining"]
+		)
+	}
+
+	created, skipped, failed = 0, 0, 0
+	for start in range(0, len(rows), SSA_CHUNK_SIZE):
+		linked = {}
+		for employee_row in rows[start:start + SSA_CHUNK_SIZE]:
+			if (employee_row.employee, getdate(employee_row.joining_date)) in existing:
+				skipped += 1
 				continue
 
 			## Create a new salary structure assignment
 			assignment_doc = frappe.new_doc("Salary Structure Assignment")
 			assignment_doc.update({
 				"employee": employee_row.employee,
-				"salary_structure": self.salary_structure,
+				"salary_structure": doc.salary_structure,
 				"from_date": employee_row.joining_date,
-				"company": self.company,
+				"company": doc.company,
 				"currency": "KES",
 				"base": employee_row.base_salary,
-				"income_tax_slab": self.income_tax_slab,
-				"payroll_payable_account": self.payroll_payable_account
+				"income_tax_slab": doc.income_tax_slab,
+				"payroll_payable_account": doc.payroll_payable_account
 			})
-			
-			assignment_doc.insert(ignore_permissions=True)
-			assignment_doc.submit()
+			assignment_doc.flags.employee_details = employees.get(employee_row.employee)
+
+			try:
+				frappe.db.savepoint("prorated_ssa")
+				assignment_doc.insert(ignore_permissions=True)
+				assignment_doc.submit()
+			except Exception:
+				frappe.db.rollback(save_point="prorated_ssa")
+				frappe.log_error(frappe.get_traceback(), f"Prorated salary structure assignment failed for {employee_row.employee}")
+				failed += 1
+				continue
 
-			employee_row.salary_structure_assignment = assignment_doc.name
-			assignments_created.append(assignment_doc.name)
+			linked[employee_row.name] = {"salary_structure_assignment": assignment_doc.name}
+			created += 1
 
-			frappe.db.commit()
+		if linked:
+			frappe.db.bulk_update("Prorated Employees", linked, update_modified=False)
+		frappe.db.commit()
+		publish_progress(doc, min(start + SSA_CHUNK_SIZE, len(rows)), len(rows))
 
-		if assignments_created:
-			frappe.msgprint(f"Created {len(assignments_created)} Salary structure assignments")
-		else:
-			frappe.msgprint("No new prorated slary structure created.")
-		##self.save()
-	
-	@frappe.whitelist(allow_guest=True)
-	def get_created_assignments(self):
-		"""Get a list of created salary structure assignments"""
-		assignments = []
-		for employee_row in self.prorated_employees:
-			if employee_row.name:
-				assignments.append(employee_row.name)
-		return assignments
-	
+	frappe.publish_realtime(SSA_PROGRESS_EVENT,
+							{"done": 1, "created": created, "skipped": skipped, "failed": failed},
+							doctype=doc.doctype, docname=doc.name)
+
+
+def get_existing_assignments(salary_structure, employees):
+	"""
+	Get the (employee, from date) pairs that already have a submitted assignment of the salary structure
+	"""
+	if not employees:
+		return set()
+
+	assignments = frappe.get_all(
+		"Salary Structure Assignment",
+		filters={"employee": ["in", employees], "salary_structure": salary_structure, "docstatus": 1},
+		fields=["employee", "from_date"]
+	)
+	return {(row.employee, getdate(row.from_date)) for row in assignments}
 
 
+def publish_progress(doc, processed, total):
+	frappe.publish_realtime(SSA_PROGRESS_EVENT, {"processed": processed, "total": total},
+							doctype=doc.doctype, docname=doc.name)
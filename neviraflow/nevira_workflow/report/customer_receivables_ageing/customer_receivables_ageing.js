@@ -0,0 +1,34 @@
+// Copyright (c) 2026, Victor Mandela, Billy Adwar & Moses Njue and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["Customer Receivables Ageing"] = {
+    filters: [
+        {
+            fieldname: "company",
+            label: __("Company"),
+            fieldtype: "Link",
+            options: "Company",
+            default: frappe.defaults.get_user_default("Company"),
+            reqd: 1
+        },
+        {
+            fieldname: "report_date",
+            label: __("Ageing As Of"),
+            fieldtype: "Date",
+            default: frappe.datetime.get_today(),
+            reqd: 1
+        },
+        {
+            fieldname: "ageing_ranges",
+            label: __("Ageing Ranges"),
+            fieldtype: "Data",
+            default: "30, 60, 90, 120"
+        },
+        {
+            fieldname: "customer",
+            label: __("Customer"),
+            fieldtype: "Link",
+            options: "Customer"
+        }
+    ]
+};
@@ -0,0 +1,36 @@
+# Copyright (c) 2026, Victor Mandela, Billy Adwar & Moses Njue and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+
+from neviraflow.receivables_engine import get_company_ageing
+
+
+def execute(filters=None):
+	filters = frappe._dict(filters or {})
+	if not filters.company:
+		frappe.throw(_("Company is required"))
+
+	ageing = get_company_ageing(filters.company, filters.report_date, filters.ageing_ranges,
+								[filters.customer] if filters.customer else None)
+	return get_columns(ageing["ranges"]), ageing["customers"]
+
+
+def get_columns(ranges):
+	columns = [
+		{"label": _("Customer"), "fieldname": "customer", "fieldtype": "Link", "options": "Customer", "width": 160},
+		{"label": _("Customer Name"), "fieldname": "customer_name", "fieldtype": "Data", "width": 200},
+		{"label": _("Invoiced Amount"), "fieldname": "invoiced_amount", "fieldtype": "Currency", "width": 130},
+		{"label": _("Paid Amount"), "fieldname": "paid_amount", "fieldtype": "Currency", "width": 130},
+		{"label": _("Credit Note"), "fieldname": "credit_note", "fieldtype": "Currency", "width": 130},
+		{"label": _("Outstanding"), "fieldname": "outstanding", "fieldtype": "Currency", "width": 130},
+	]
+
+	lower = 0
+	for index, upper in enumerate(ranges):
+		columns.append({"label": f"{lower}-{upper}", "fieldname": f"range{index + 1}", "fieldtype": "Currency", "width": 120})
+		lower = upper + 1
+	columns.append({"label": _("{0}-Above").format(lower), "fieldname": f"range{len(ranges) + 1}",
+					"fieldtype": "Currency", "width": 120})
+	return columns
@@ -0,0 +1,179 @@
+import frappe
+from frappe.utils import getdate, flt
+
+
+MATRIX_CACHE_PREFIX = "neviraflow_attendance_matrix"
+MATRIX_PERIODS_KEY = "neviraflow_attendance_matrix_periods"
+MATRIX_CACHE_TTL = 24 * 60 * 60
+
+EMPTY_ROW = {
+    "present": 0,
+    "absent": 0,
+    "on_leave": 0,
+    "half_day": 0,
+    "holiday_worked": 0,
+    "marked_days": 0,
+    "overtime_hours": 0
+}
+
+
+def get_attendance_matrix(start_date, end_date) -> dict:
+    """
+    Get the attendance counts of every employee for a payroll period:
+    present, absent, on leave, half day, holidays worked, total marked days and overtime hours.
+    The matrix is built with one grouped query and cached until Attendance in the period is
+    submitted or cancelled, so the Salary Slip hooks of a payroll run share a single query.
+    """
+    start_date, end_date = getdate(start_date), getdate(end_date)
+    key = get_matrix_key(start_date, end_date)
+
+    matrix = frappe.cache().get_value(key)
+    if matrix is None:
+        matrix = build_attendance_matrix(start_date, end_date)
+        frappe.cache().set_value(key, matrix, expires_in_sec=MATRIX_CACHE_TTL)
+        frappe.cache().hset(MATRIX_PERIODS_KEY, key, f"{start_date}|{end_date}")
+    return matrix
+
+
+def get_employee_attendance(employee, start_date, end_date) -> dict:
+    """
+    Get one employee's row of the period matrix, zeros when nothing is marked
+    """
+    return get_attendance_matrix(start_date, end_date).get(employee) or dict(EMPTY_ROW)
+
+
+def build_attendance_matrix(start_date, end_date) -> dict:
+    rows = frappe.db.sql("""
+                SELECT
+                    employee,
+                    SUM(status = 'Present') AS present,
+                    SUM(status = 'Absent') AS absent,
+                    SUM(status = 'On Leave') AS on_leave,
+                    SUM(status = 'Half Day') AS half_day,
+                    COUNT(name) AS marked_days,
+                    SUM(custom_overtime_hours) AS overtime_hours
+                FROM `tabAttendance`
+                WHERE docstatus = 1
+                AND attendance_date BETWEEN %(start_date)s AND %(end_date)s
+                GROUP BY employee
+                """, {"start_date": start_date, "end_date": end_date}, as_dict=True)
+
+    matrix = {}
+    for row in rows:
+        matrix[row.employee] = {field: int(row.get(field) or 0) for field in EMPTY_ROW}
+        matrix[row.employee]["overtime_hours"] = flt(row.overtime_hours, 2)
+    for employee, worked in get_holidays_worked(start_date, end_date).items():
+        if employee in matrix:
+            matrix[employee]["holiday_worked"] = worked
+    return matrix
+
+
+def get_holidays_worked(start_date, end_date) -> dict:
+    """
+    Count the named holidays each employee was present on in the period.
+    The holiday lists are loaded once per period as sets of dates and matched against
+    the present attendance on any of those dates, fetched in one query.
+    """
+    employee_lists = get_employee_holiday_lists()
+    holidays = get_named_holidays(set(employee_lists.values()), start_date, end_date)
+    all_dates = set().union(*holidays.values()) if holidays else set()
+    if not all_dates:
+        return {}
+
+    rows = frappe.db.sql("""
+                SELECT employee, attendance_date
+                FROM `tabAttendance`
+                WHERE docstatus = 1
+                AND status = 'Present'
+                AND attendance_date IN %(dates)s
+                """, {"dates": tuple(all_dates)}, as_dict=True)
+
+    worked = {}
+    for row in rows:
+        if getdate(row.attendance_date) in holidays.get(employee_lists.get(row.employee), ()):
+            worked[row.employee] = worked.get(row.employee, 0) + 1
+    return worked
+
+
+def get_employee_holiday_lists() -> dict:
+    """
+    Map every employee to the holiday list that applies to them, their own or their company's default
+    """
+    company_lists = {
+        row.name: row.default_holiday_list
+        for row in frappe.get_all("Company", fields=["name", "default_holiday_list"])
+    }
+    return {
+        row.name: row.holiday_list or company_lists.get(row.company)
+        for row in frappe.get_all("Employee", fields=["name", "company", "holiday_list"])
+    }
+
+
+def get_named_holidays(holiday_lists, start_date, end_date) -> dict:
+    """
+    Get the named holidays (weekly offs excluded) of each holiday list within the period as sets of dates
+    """
+    holiday_lists = [name for name in holiday_lists if name]
+    if not holiday_lists:
+        return {}
+
+    rows = frappe.get_all("Holiday",
+                          filters={"parent": ["in", holiday_lists],
+                                   "holiday_date": ["between", [start_date, end_date]],
+                                   "weekly_off": 0},
+                          fields=["parent", "holiday_date"])
+
+    by_list = {}
+    for row in rows:
+        by_list.setdefault(row.parent, set()).add(getdate(row.holiday_date))
+    return by_list
+
+
+def get_matrix_key(start_date, end_date) -> str:
+    return f"{MATRIX_CACHE_PREFIX}::{start_date}::{end_date}"
+
+
+def invalidate_attendance_matrix(doc, method=None):
+    """
+    Attendance on_submit/on_cancel hook: drop the cached matrices of the periods covering the attendance date
+    """
+    attendance_date = getdate(doc.attendance_date)
+    clear_matrix_cache(lambda start, end: start <= attendance_date <= end)
+
+
+def invalidate_period_matrix(from_date, to_date):
+    """
+    Drop the cached matrices of the periods overlapping the dates, after Attendance is changed without hooks
+    """
+    from_date, to_date = getdate(from_date), getdate(to_date)
+    clear_matrix_cache(lambda start, end: start <= to_date and from_date <= end)
+
+
+def invalidate_holiday_matrix(doc, method=None):
+    """
+    Holiday List on_update/on_trash hook: drop the cached matrices of the periods the list overlaps
+    """
+    from_date, to_date = getdate(doc.from_date), getdate(doc.to_date)
+    clear_matrix_cache(lambda start, end: start <= to_date and from_date <= end)
+
+
+def invalidate_employee_matrix(doc, method=None):
+    """
+    Employee on_update hook: the holidays worked follow the employee's holiday list, or their company's default,
+    so a change of either drops every cached matrix
+    """
+    if doc.has_value_changed("holiday_list") or doc.has_value_changed("company"):
+        clear_matrix_cache()
+
+
+def clear_matrix_cache(matches=None):
+    """
+    Drop the cached matrices of the periods for which matches(start, end) is true, or all of them
+    """
+    periods = frappe.cache().hgetall(MATRIX_PERIODS_KEY) or {}
+    for key, period in periods.items():
+        key = frappe.safe_decode(key)
+        start, end = (getdate(d) for d in frappe.safe_decode(period).split("|"))
+        if matches is None or matches(start, end):
+            frappe.cache().delete_value(key)
+            frappe.cache().hdel(MATRIX_PERIODS_KEY, key)
@@ -0,0 +1,85 @@
+import frappe
+from frappe.utils import getdate, flt
+
+from neviraflow.payroll_attendance_matrix import get_attendance_matrix
+
+
+PAYROLL_BATCH_PREFIX = "neviraflow_payroll_batch"
+PAYROLL_BATCH_PERIODS_KEY = "neviraflow_payroll_batch_periods"
+PAYROLL_BATCH_TTL = 6 * 60 * 60
+
+
+def prefetch_payroll_entry(doc, method=None):
+    """
+    Payroll Entry before_submit hook.
+    Salary slips are created on submit, either inline or in a background job. Prefetch the employee
+    details and daily rates of every employee in the entry in one query and warm the period attendance
+    matrix, so each slip's hooks read from the cache instead of querying per slip.
+    """
+    employees = [row.employee for row in doc.get("employees") or [] if row.employee]
+    if not employees or not doc.start_date or not doc.end_date:
+        return
+
+    cache_payroll_batch(employees, doc.start_date, doc.end_date)
+    get_attendance_matrix(doc.start_date, doc.end_date)
+
+
+def cache_payroll_batch(employees, start_date, end_date):
+    """
+    Load the employees' joining date, CTC and daily rate in one query and cache them for the period
+    """
+    rows = frappe.get_all("Employee",
+                          filters={"name": ["in", employees]},
+                          fields=["name", "date_of_joining", "ctc", "custom_daily_salary_rate"])
+
+    key = get_batch_key(start_date, end_date)
+    for row in rows:
+        frappe.cache().hset(key, row.name, {
+            "date_of_joining": row.date_of_joining,
+            "ctc": flt(row.ctc),
+            "daily_rate": flt(row.custom_daily_salary_rate)
+        })
+    frappe.cache().expire(frappe.cache().make_key(key), PAYROLL_BATCH_TTL)
+    frappe.cache().hset(PAYROLL_BATCH_PERIODS_KEY, key, 1)
+    return len(rows)
+
+
+def get_payroll_employee(employee, start_date, end_date):
+    """
+    Get the employee's prefetched payroll details for the period.
+    Falls back to one query when the slip is not part of a prefetched payroll run
+    """
+    row = frappe.cache().hget(get_batch_key(start_date, end_date), employee)
+    if row:
+        return frappe._dict(row)
+
+    date_of_joining, ctc, daily_rate = frappe.db.get_value(
+        "Employee", employee, ["date_of_joining", "ctc", "custom_daily_salary_rate"]
+    ) or (None, 0, 0)
+    return frappe._dict({"date_of_joining": date_of_joining, "ctc": flt(ctc), "daily_rate": flt(daily_rate)})
+
+
+def clear_payroll_batch(employees=None):
+    """
+    Drop the prefetched payroll details, for some employees or for all periods
+    """
+    periods = frappe.cache().hgetall(PAYROLL_BATCH_PERIODS_KEY) or {}
+    for key in periods:
+        key = frappe.safe_decode(key)
+        if employees:
+            for employee in employees:
+                frappe.cache().hdel(key, employee)
+        else:
+            frappe.cache().delete_value(key)
+            frappe.cache().hdel(PAYROLL_BATCH_PERIODS_KEY, key)
+
+
+def clear_employee_payroll_batch(doc, method=None):
+    """
+    Employee on_update hook: a changed CTC or daily rate must not be served from a prefetched run
+    """
+    clear_payroll_batch([doc.name])
+
+
+def get_batch_key(start_date, end_date) -> str:
+    return f"{PAYROLL_BATCH_PREFIX}::{getdate(start_date)}::{getdate(end_date)}"
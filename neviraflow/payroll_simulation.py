@@ -0,0 +1,99 @@
+import frappe
+from frappe import _
+from frappe.utils import getdate, flt
+
+from neviraflow.payroll_attendance_matrix import get_attendance_matrix, EMPTY_ROW
+from neviraflow.attendance_ratio import compute_attendance_ratio, MIN_ATTENDANCE_RATIO
+
+
+@frappe.whitelist()
+def simulate_payroll(start_date, end_date, company=None):
+    """
+    Preview a payroll run without saving anything: proration, absent day deductions, holiday overtime
+    and the 75% attendance block for every employee, with the same rules as the Salary Structure
+    Assignment and Salary Slip hooks. Employees and the period attendance matrix are loaded once and
+    the results computed in a single pass.
+    """
+    frappe.only_for(("HR Manager", "HR User", "System Manager"))
+
+    start_date, end_date = getdate(start_date), getdate(end_date)
+    if start_date > end_date:
+        frappe.throw(_("Start Date cannot be after End Date"))
+
+    filters = {"status": "Active"}
+    if company:
+        filters["company"] = company
+
+    employees = frappe.get_all("Employee",
+                               filters=filters,
+                               fields=["name", "employee_name", "ctc", "custom_daily_salary_rate", "date_of_joining"],
+                               order_by="name")
+    matrix = get_attendance_matrix(start_date, end_date)
+
+    results = []
+    totals = frappe._dict({
+        "employees": 0,
+        "prorated": 0,
+        "blocked": 0,
+        "missing_ctc": 0,
+        "absent_days_deduction": 0,
+        "overtime_amount": 0,
+        "base": 0
+    })
+
+    for emp in employees:
+        if emp.date_of_joining and getdate(emp.date_of_joining) > end_date:
+            continue
+
+        row = simulate_employee(emp, matrix.get(emp.name) or EMPTY_ROW, start_date, end_date)
+        results.append(row)
+
+        totals.employees += 1
+        totals.prorated += row["is_prorated"]
+        totals.blocked += row["blocked"]
+        totals.missing_ctc += row["missing_ctc"]
+        totals.absent_days_deduction += row["absent_days_deduction"]
+        totals.overtime_amount += row["overtime_amount"]
+        totals.base += row["base"]
+
+    return {"employees": results, "totals": totals}
+
+
+def simulate_employee(emp, attendance, start_date, end_date) -> dict:
+    """
+    One employee's outcome, mirroring before_submit_salary_structure_assignment and the slip hooks
+    """
+    ctc = flt(emp.ctc)
+    daily_rate = flt(emp.custom_daily_salary_rate)
+    joining_date = getdate(emp.date_of_joining) if emp.date_of_joining else start_date
+
+    if joining_date > start_date:
+        worked_days = max(0, (end_date - joining_date).days + 1)
+        prorated_amount = daily_rate * worked_days
+        is_prorated = 1
+    else:
+        worked_days = 30
+        prorated_amount = ctc
+        is_prorated = 0
+
+    absent_days_deduction = daily_rate * attendance["absent"]
+    overtime_amount = daily_rate * attendance["holiday_worked"]
+    ratio = compute_attendance_ratio(attendance["marked_days"], joining_date, start_date, end_date)
+
+    return {
+        "employee": emp.name,
+        "employee_name": emp.employee_name,
+        "ctc": ctc,
+        "daily_rate": daily_rate,
+        "is_prorated": is_prorated,
+        "worked_days": worked_days,
+        "prorated_amount": flt(prorated_amount, 2),
+        "absent_days": attendance["absent"],
+        "absent_days_deduction": flt(absent_days_deduction, 2),
+        "holiday_days_worked": attendance["holiday_worked"],
+        "overtime_amount": flt(overtime_amount, 2),
+        "base": flt(prorated_amount + overtime_amount - absent_days_deduction, 2),
+        "attendance_ratio": ratio["ratio"],
+        "blocked": int(ratio["ratio"] < MIN_ATTENDANCE_RATIO),
+        "missing_ctc": int(ctc <= 0)
+    }
@@ -5,6 +5,8 @@ import requests
 from datetime import datetime
 from frappe.utils import nowdate, flt
 
+from neviraflow.party_balance import get_party_balance
+
 # -------------------------
 # UTILITY: FETCH EXCHANGE RATE (Frankfurter API)
 # -------------------------
@@ -98,22 +100,8 @@ def _validate_cod_backlog(doc):
         frappe.throw(f"Customer has previous Cash On Delivery orders not fully billed or paid: {orders}. Please settle them before submitting a new one.")
 
 def _validate_advance_payment(doc):
-    ## Get advance payments from the General Ledger entries
-    balance_query = frappe.db.sql("""
-                    SELECT
-                        (SUM(gl.credit) - SUM(gl.debit)) AS balance_amount 
-                        FROM `tabGL Entry` AS gl WHERE gl.docstatus = 1 AND
-                        gl.is_cancelled = 0 AND gl.party = %s GROUP BY gl.party 
-                    """, (doc.customer), as_dict=True)
-    
-    ## Initialize the balance amount
-    balance_amount = 0
-    
-    ## Set balance_amount to 0 if no records found
-    if not balance_query:
-        balance_amount = 0
-    else:
-        balance_amount = balance_query[0].get("balance_amount")
+    ## Get advance payments from the maintained party balance, credit balance is what the customer has paid ahead
+    balance_amount = -get_party_balance(doc.customer, "Customer")
 
     tds_threshold = 0.05 ## setting the  tax-witholding threshold
 
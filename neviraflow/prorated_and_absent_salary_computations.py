@@ -1,9 +1,13 @@
 from frappe.utils import datetime, flt
 import frappe
 import json
-from frappe.utils import getdate, get_first_day, get_last_day, date_diff
-from frappe.query_builder import DocType
-from frappe.query_builder.functions import Count
+from frappe.utils import getdate, get_first_day, get_last_day
+
+from neviraflow.payroll_attendance_matrix import get_employee_attendance
+from neviraflow.payroll_batch import get_payroll_employee
+from neviraflow.attendance_ratio import (
+    get_attendance_ratio, find_low_attendance_employees, format_low_attendance, MIN_ATTENDANCE_RATIO
+)
 
 def get_absent_days_sql(employee, start_date, end_date):
     """
@@ -18,43 +22,12 @@ def get_absent_days_sql(employee, start_date, end_date):
     result = frappe.db.sql(absent_sql,(employee, start_date, end_date), as_dict=True)
     return result[0]['absent_days'] if result else 0
 
-### This is the code block that gets us the holidays within a month i.e named holidays
-def get_worked_days_on_holidays(employee):
-    worked_days_sql = """
-                        SELECT
-                            employee,
-                            COUNT(name) AS worked_days
-                            FROM
-                            `tabAttendance`
-                            WHERE
-                            docstatus = 1
-                            AND attendance_date = '2026-01-01'
-			    AND status = 'Present'
-                            AND employee = %s
-                            GROUP BY
-                            employee"""
-    res = frappe.db.sql(worked_days_sql, (employee), as_dict=True)
-    return res[0]['worked_days'] if res else 0
-
 
 def get_absent_days(employee, start_date, end_date):
     """
-    Get the absent days marked for the emplyee in the given period using frappe.qb
+    Get the absent days marked for the emplyee in the given period from the cached period attendance matrix
     """
-    Attendance = DocType("Attendance")
-    query = (frappe.qb.from_(Attendance)
-             .select(Count(Attendance.name).as_('absent_days'))
-             .where(
-                (Attendance.docstatus == 1)
-                & (Attendance.employee == employee)
-                & (Attendance.status == "Absent")
-                & (Attendance.attendance_date >= start_date)
-                & (Attendance.attendance_date <= end_date)
-                )
-            )
-    result = query.run()
-
-    return result[0][0] if result else 0
+    return get_employee_attendance(employee, start_date, end_date)["absent"]
 
 
 
@@ -64,7 +37,8 @@ def before_submit_salary_structure_assignment(doc, method):
     """
     payroll_start_date = doc.from_date
     payroll_end_date = get_last_day(doc.from_date)  ### instead of using doc.to_date which does not exist
-    employee = frappe.get_doc("Employee", doc.employee)
+    ### Prefetched by the bulk prorated assignment job, loaded here otherwise
+    employee = doc.flags.employee_details or frappe.get_doc("Employee", doc.employee)
 
     ### Extract the employee details  to get the value of ctc & daily rate from the employee directly
     if employee.ctc:
@@ -102,7 +76,7 @@ def before_submit_salary_structure_assignment(doc, method):
     doc.custom_absent_days_deduction = daily_rate * absent_days
 
     ## worked_days on holidays
-    overtime_days = get_worked_days_on_holidays(doc.employee)
+    overtime_days = get_employee_attendance(doc.employee, payroll_start_date, payroll_end_date)["holiday_worked"]
     doc.custom_overtime_amount = flt(overtime_days * daily_rate)
     doc.custom_holiday_days_worked = overtime_days
 
@@ -121,24 +95,29 @@ def compute_and_set_absent_days(doc, method=None):
     employee_id = doc.employee
     start_date = doc.start_date
     end_date = doc.end_date
-    new_absent_days = get_absent_days(employee_id, start_date, end_date)
-    overtime_days = get_worked_days_on_holidays(doc.employee)
+    attendance = get_employee_attendance(employee_id, start_date, end_date)
+    new_absent_days = attendance["absent"]
+    overtime_days = attendance["holiday_worked"]
     
 
 
     if new_absent_days > 0:
         doc.custom_computed_absent_days = new_absent_days
-        daily_rate = doc.custom_daily_pay
+        daily_rate = doc.custom_daily_pay or get_payroll_employee(employee_id, start_date, end_date).daily_rate
         absent_days_deduction = new_absent_days * daily_rate 
         doc.custom_absent_days_deduction = absent_days_deduction
     else:
         doc.custom_absent_days_deduction = 0
 
     if overtime_days > 0:
-        doc.custom_overtime_amount_addition = flt(overtime_days * doc.custom_daily_pay)
+        daily_rate = doc.custom_daily_pay or get_payroll_employee(employee_id, start_date, end_date).daily_rate
+        doc.custom_overtime_amount_addition = flt(overtime_days * daily_rate)
     else:
         doc.custom_overtime_amount_addition = 0
 
+    ### Hours worked past the shift end, paid through the salary structure's OT1 component formula
+    doc.custom_overtime_hours = attendance.get("overtime_hours", 0)  ## Matrices cached before the field have none
+
 
 
 ##  Custom function to check the attendance_ratio for the employee within that month and not submit the salary slip if the ratio is below 75%
@@ -146,57 +125,33 @@ def compute_and_set_absent_days(doc, method=None):
 def calculate_attendance_ratio(doc, method):
     """
     Computes and stores marked attendance ratio on Salary Slip during validation.
+    The ratio is cached per employee and period, so repeated saves during review do no counting.
     """
 
     if not doc.employee or not doc.start_date or not doc.end_date:
         return
 
-    employee = frappe.get_doc("Employee", doc.employee)
-
-    start_date = getdate(doc.start_date)
-    end_date = getdate(doc.end_date)
-    joining_date = getdate(employee.date_of_joining)
-
-    # Determine total days to be marked
-    if joining_date <= start_date:
-        total_days = date_diff(end_date, start_date) + 1
-        adjusted_days = total_days - 6
-    else:
-        total_days = date_diff(end_date, joining_date) + 1
-        adjusted_days = total_days - 3
-
-    # Guard against invalid day counts
-    if adjusted_days <= 0:
-        doc.custom_marked_attendance_ratio = 0
-        return
-    
-    # Count marked attendance
-    marked_days = frappe.db.count(
-        "Attendance",
-        {
-            "employee": doc.employee,
-            "attendance_date": ["between", [start_date, end_date]],
-            "docstatus": 1
-        }
-    )
-
-    # Compute attendance ratio
-    attendance_ratio = (marked_days / adjusted_days) * 100
-    doc.custom_marked_attendance_ratio = round(attendance_ratio, 2)
+    doc.custom_marked_attendance_ratio = get_attendance_ratio(doc.employee, doc.start_date, doc.end_date).ratio
 
 
 def block_submission_if_low_attendance(doc, method):
     """
     Prevents submission of Salary Slip if attendance ratio is below 75%.
+    Slips of a Payroll Entry also list the other low-ratio employees of the run, so they can be fixed together.
     """
 
-    if doc.custom_marked_attendance_ratio > 75:
+    if doc.custom_marked_attendance_ratio >= MIN_ATTENDANCE_RATIO:
         return
 
-    if doc.custom_marked_attendance_ratio < 75:
-        frappe.throw(
-            f"Attendance Ratio is {doc.custom_marked_attendance_ratio:.2f}%. "
-            "Salary Slip cannot be submitted if attendance ratio is below 75%. " \
-            "Employee has an issue with their attendance within the month, which need to be investigated and marked before submitting the salary slip.!"
-        )
+    message = (
+        f"Attendance Ratio is {doc.custom_marked_attendance_ratio:.2f}%. "
+        "Salary Slip cannot be submitted if attendance ratio is below 75%. " \
+        "Employee has an issue with their attendance within the month, which need to be investigated and marked before submitting the salary slip.!"
+    )
+
+    if doc.payroll_entry:
+        others = [row for row in find_low_attendance_employees(doc.payroll_entry) if row["employee"] != doc.employee]
+        if others:
+            message += f"<br><br>Other employees below 75% in {doc.payroll_entry}: {format_low_attendance(others)}"
 
+    frappe.throw(message)
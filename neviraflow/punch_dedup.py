@@ -0,0 +1,141 @@
+from bisect import bisect_right
+from datetime import timedelta
+
+import frappe
+from frappe.utils import get_datetime, cint
+
+
+LAST_PUNCH_CACHE_KEY = "neviraflow_last_punch"
+DEFAULT_DEDUP_WINDOW_SECONDS = 120
+
+
+def get_dedup_window() -> int:
+    """
+    De-duplication window in seconds, set with `bench set-config checkin_dedup_window_seconds 120`.
+    0 disables the check
+    """
+    return cint(frappe.conf.get("checkin_dedup_window_seconds", DEFAULT_DEDUP_WINDOW_SECONDS))
+
+
+def mark_duplicate_punch(doc, method=None):
+    """
+    Employee Checkin before_insert hook.
+    A punch within the window of a stored punch of the employee (a double tap or a device resend) is kept
+    for the record but marked: it takes the previous log type instead of flipping IN/OUT and the
+    attendance hooks skip it.
+    """
+    window = get_dedup_window()
+    if not window or not doc.employee or not doc.time:
+        return
+
+    ts = get_datetime(doc.time)
+    last_time = get_last_punch_times([doc.employee]).get(doc.employee)
+    ## Nothing is stored after the latest punch, a live punch past its window needs no lookup
+    if not last_time or ts - timedelta(seconds=window) >= last_time:
+        return
+
+    if get_stored_punch_times([doc.employee], ts, ts, window).get(doc.employee):
+        doc.flags.duplicate_punch = True
+        doc.skip_auto_attendance = 1
+
+
+def drop_window_duplicates(rows):
+    """
+    Drop the punches of a batch that fall within the window of the employee's previous kept punch
+    of the batch, or of any stored punch of the employee, earlier or later.
+    Stored punches around the batch are loaded with one range query.
+    Rows must be sorted by (employee, time). Returns (kept rows, number dropped)
+    """
+    window = get_dedup_window()
+    if not window or not rows:
+        return rows, 0
+
+    first_times = {}
+    for row in rows:
+        first_times.setdefault(row.employee, get_datetime(row.time))
+
+    ## Only employees whose latest stored punch reaches into the batch need the stored punches
+    last_times = get_last_punch_times(list(first_times))
+    employees = [employee for employee, first_time in first_times.items()
+                 if last_times.get(employee) and first_time - timedelta(seconds=window) < last_times[employee]]
+    times = [get_datetime(row.time) for row in rows]
+    stored = get_stored_punch_times(employees, min(times), max(times), window) if employees else {}
+
+    kept, dropped = [], 0
+    previous = {}
+    for row, ts in zip(rows, times):
+        previous_time = previous.get(row.employee)
+        if (previous_time and (ts - previous_time).total_seconds() < window) \
+                or has_punch_within(stored.get(row.employee), ts, window):
+            dropped += 1
+            continue
+        kept.append(row)
+        previous[row.employee] = ts
+    return kept, dropped
+
+
+def get_stored_punch_times(employees, from_time, to_time, window) -> dict:
+    """
+    Get the employees' stored punch times from the window before from_time to the window after to_time,
+    sorted per employee, in one query
+    """
+    checkins = frappe.db.sql("""
+                SELECT employee, time
+                FROM `tabEmployee Checkin`
+                WHERE employee IN %s
+                AND time > %s
+                AND time < %s
+                ORDER BY employee, time
+                """, (tuple(employees), from_time - timedelta(seconds=window), to_time + timedelta(seconds=window)),
+                as_dict=True)
+
+    stored = {}
+    for checkin in checkins:
+        stored.setdefault(checkin.employee, []).append(get_datetime(checkin.time))
+    return stored
+
+
+def has_punch_within(times, ts, window) -> bool:
+    """
+    Whether any of the sorted punch times is less than the window away from ts
+    """
+    if not times:
+        return False
+    index = bisect_right(times, ts - timedelta(seconds=window))
+    return index < len(times) and (times[index] - ts).total_seconds() < window
+
+
+def get_last_punch_times(employees):
+    """
+    Get each employee's latest punch time from the redis hash, falling back to one grouped query for misses
+    """
+    last_times = {}
+    misses = []
+    for employee in employees:
+        cached = frappe.cache().hget(LAST_PUNCH_CACHE_KEY, employee)
+        if cached:
+            last_times[employee] = get_datetime(cached)
+        else:
+            misses.append(employee)
+
+    if misses:
+        rows = frappe.db.sql("""
+                SELECT employee, MAX(time) AS last_time
+                FROM `tabEmployee Checkin`
+                WHERE employee IN %s
+                GROUP BY employee
+                """, (tuple(misses),), as_dict=True)
+        for row in rows:
+            last_times[row.employee] = get_datetime(row.last_time)
+            frappe.cache().hset(LAST_PUNCH_CACHE_KEY, row.employee, str(row.last_time))
+    return last_times
+
+
+def remember_punch(employee, time):
+    """
+    Record the punch in the recent-punch hash if it's the employee's latest
+    """
+    ts = get_datetime(time)
+    cached = frappe.cache().hget(LAST_PUNCH_CACHE_KEY, employee)
+    if not cached or ts > get_datetime(cached):
+        frappe.cache().hset(LAST_PUNCH_CACHE_KEY, employee, str(ts))
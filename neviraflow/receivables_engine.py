@@ -0,0 +1,387 @@
+from bisect import bisect_left
+
+import frappe
+from frappe import _
+from frappe.utils import getdate, flt, cint, add_days
+
+from neviraflow.party_balance import get_party_totals_on, get_parties_totals_on
+
+
+DEFAULT_AGEING_RANGES = (30, 60, 90, 120)
+
+
+def get_ledger_lines(company, customer, from_date, to_date):
+    """
+    The customer's General Ledger for the period, grouped by voucher, account and cost center, laid out like the
+    General Ledger report with "Group by Voucher (Consolidated)" and opening entries shown:
+    an Opening row, the voucher lines with a running balance, then the Total and Closing rows
+    """
+    return get_customers_ledger_lines(company, [customer], from_date, to_date)[customer]
+
+
+def get_customers_ledger_lines(company, customers, from_date, to_date) -> dict:
+    """
+    The ledger lines of a set of customers for the period from one opening lookup and one grouped
+    GL query for all of them, with the references resolved in one pass. Returns {customer: lines}
+    """
+    from_date, to_date = getdate(from_date), getdate(to_date)
+    params = {"company": company, "customers": tuple(customers), "from_date": from_date, "to_date": to_date}
+
+    openings = get_parties_totals_on(customers, add_days(from_date, -1), "Customer", company)
+
+    entries = frappe.db.sql("""
+                SELECT
+                    party, posting_date, account, voucher_type, voucher_no, cost_center,
+                    SUM(debit) AS debit, SUM(credit) AS credit
+                FROM `tabGL Entry`
+                WHERE company = %(company)s
+                AND party_type = 'Customer'
+                AND party IN %(customers)s
+                AND is_cancelled = 0
+                AND posting_date BETWEEN %(from_date)s AND %(to_date)s
+                GROUP BY party, posting_date, voucher_type, voucher_no, account, cost_center
+                ORDER BY party, posting_date, account, MIN(creation), voucher_type, voucher_no, cost_center
+                """, params, as_dict=True)
+
+    entries_by_customer = {}
+    for row in entries:
+        entries_by_customer.setdefault(row.party, []).append(row)
+
+    ledger = {}
+    for customer in customers:
+        opening_debit, opening_credit = openings.get(customer, (0, 0))
+        customer_entries = entries_by_customer.get(customer, [])
+        total_debit = sum(flt(row.debit) for row in customer_entries)
+        total_credit = sum(flt(row.credit) for row in customer_entries)
+
+        lines = [frappe._dict({"account": "'Opening'", "debit": opening_debit, "credit": opening_credit,
+                               "balance": opening_debit - opening_credit})]
+
+        balance = opening_debit - opening_credit
+        for row in customer_entries:
+            balance += flt(row.debit) - flt(row.credit)
+            lines.append(frappe._dict({
+                "posting_date": row.posting_date,
+                "account": row.account,
+                "voucher_type": row.voucher_type,
+                "voucher_no": row.voucher_no,
+                "debit": flt(row.debit),
+                "credit": flt(row.credit),
+                "balance": balance
+            }))
+
+        lines.append(frappe._dict({"account": "'Total'", "debit": total_debit, "credit": total_credit,
+                                   "balance": total_debit - total_credit}))
+        closing_debit, closing_credit = opening_debit + total_debit, opening_credit + total_credit
+        lines.append(frappe._dict({"account": "'Closing (Opening + Total)'", "debit": closing_debit,
+                                   "credit": closing_credit, "balance": closing_debit - closing_credit}))
+        ledger[customer] = lines
+
+    resolve_statement_references([line for lines in ledger.values() for line in lines])
+    return ledger
+
+
+def get_ledger_page(company, customer, from_date, to_date, start=0, page_length=100):
+    """
+    One page of the customer's ledger lines for the period with the running balance carried in
+    from the opening balance and the lines before the page, plus the line count for paging.
+    The grouping columns complete the order so pages neither repeat nor skip lines
+    """
+    from_date, to_date = getdate(from_date), getdate(to_date)
+    params = {"company": company, "customer": customer, "from_date": from_date, "to_date": to_date,
+              "start": cint(start), "page_length": cint(page_length)}
+    grouped = """
+                SELECT
+                    posting_date, account, voucher_type, voucher_no, cost_center,
+                    SUM(debit) AS debit, SUM(credit) AS credit, MIN(creation) AS creation
+                FROM `tabGL Entry`
+                WHERE company = %(company)s
+                AND party_type = 'Customer'
+                AND party = %(customer)s
+                AND is_cancelled = 0
+                AND posting_date BETWEEN %(from_date)s AND %(to_date)s
+                GROUP BY posting_date, voucher_type, voucher_no, account, cost_center
+    """
+
+    total = frappe.db.sql(f"SELECT COUNT(*) FROM ({grouped}) lines", params)[0][0]
+    before = frappe.db.sql(f"""
+                SELECT IFNULL(SUM(debit), 0), IFNULL(SUM(credit), 0)
+                FROM ({grouped} ORDER BY posting_date, account, creation, voucher_type, voucher_no, cost_center LIMIT %(start)s) lines
+                """, params)[0]
+    entries = frappe.db.sql(f"""
+                {grouped}
+                ORDER BY posting_date, account, creation, voucher_type, voucher_no, cost_center
+                LIMIT %(start)s, %(page_length)s
+                """, params, as_dict=True)
+
+    opening_debit, opening_credit = get_party_totals_on(customer, add_days(from_date, -1), "Customer", company)
+    balance = opening_debit - opening_credit + flt(before[0]) - flt(before[1])
+
+    lines = []
+    for row in entries:
+        balance += flt(row.debit) - flt(row.credit)
+        lines.append(frappe._dict({
+            "posting_date": row.posting_date,
+            "account": row.account,
+            "voucher_type": row.voucher_type,
+            "voucher_no": row.voucher_no,
+            "debit": flt(row.debit),
+            "credit": flt(row.credit),
+            "balance": balance
+        }))
+
+    return {
+        "total": total,
+        "start": cint(start),
+        "opening_balance": opening_debit - opening_credit,
+        "rows": resolve_statement_references(lines)
+    }
+
+
+def resolve_statement_references(lines):
+    """
+    Set the cheque reference of Payment Entry lines and the currency of each line's account,
+    fetched with one query per doctype for the whole statement instead of one per line
+    """
+    payment_entries = list({row.voucher_no for row in lines if row.get("voucher_type") == "Payment Entry"})
+    accounts = list({row.account for row in lines if row.get("voucher_no") and row.get("account")})
+
+    references = dict(frappe.get_all("Payment Entry",
+                                     filters={"name": ["in", payment_entries]},
+                                     fields=["name", "reference_no"],
+                                     as_list=True)) if payment_entries else {}
+    currencies = dict(frappe.get_all("Account",
+                                     filters={"name": ["in", accounts]},
+                                     fields=["name", "account_currency"],
+                                     as_list=True)) if accounts else {}
+
+    for row in lines:
+        row.cheque_reference_no = (references.get(row.voucher_no) or "") if row.get("voucher_type") == "Payment Entry" else ""
+        row.account_currency = currencies.get(row.get("account"))
+    return lines
+
+
+def get_open_invoices(company, customer, report_date, ranges=DEFAULT_AGEING_RANGES, start=None, page_length=None):
+    """
+    The customer's open vouchers as of the report date from the Payment Ledger, with invoiced, paid,
+    credit note and outstanding amounts and the outstanding aged by due date into the ranges,
+    as the Accounts Receivable report computes them. Optionally one page of them
+    """
+    return get_customers_open_invoices(company, [customer], report_date, ranges, start, page_length).get(customer, [])
+
+
+def get_customers_open_invoices(company, customers, report_date, ranges=DEFAULT_AGEING_RANGES,
+                                start=None, page_length=None) -> dict:
+    """
+    The open vouchers of a set of customers from one Payment Ledger query, with the Accounts Receivable
+    report's columns (invoice_grand_total, invoiced, paid, credit_note, outstanding, range1..). Returns {customer: rows}
+    """
+    report_date = getdate(report_date)
+    columns = get_outstanding_vouchers(company, report_date, customers, start, page_length)
+    buckets = get_ageing_buckets(columns, report_date, ranges)
+
+    open_invoices = {}
+    for i in range(len(columns["voucher_no"])):
+        row = frappe._dict({field: values[i] for field, values in columns.items()})
+        ## The Accounts Receivable report takes the invoice grand total from the voucher's invoiced amount
+        row.invoice_grand_total = row.invoiced
+        for index in range(len(ranges) + 1):
+            row[f"range{index + 1}"] = row.outstanding if buckets[i] == index else 0
+        open_invoices.setdefault(row.party, []).append(row)
+    return open_invoices
+
+
+def get_outstanding_vouchers(company, report_date, customers=None, start=None, page_length=None) -> dict:
+    """
+    Load the open vouchers of a set of customers, or of every customer, as of the report date into
+    column lists (party, voucher_type, voucher_no, posting_date, due_date, invoiced, paid, credit_note, outstanding),
+    grouped per voucher in one Payment Ledger query, optionally one page of them
+    """
+    params = get_outstanding_params(company, report_date, customers)
+    limit = ""
+    if page_length:
+        params.update({"start": cint(start), "page_length": cint(page_length)})
+        limit = "LIMIT %(start)s, %(page_length)s"
+
+    vouchers = frappe.db.sql(f"""
+                SELECT *
+                FROM ({get_outstanding_query(customers)}) vouchers
+                ORDER BY party, COALESCE(posting_date, due_date, %(report_date)s), voucher_no
+                {limit}
+                """, params, as_dict=True)
+
+    columns = {field: [] for field in ("party", "voucher_type", "voucher_no", "posting_date", "due_date",
+                                       "invoiced", "paid", "credit_note", "outstanding")}
+    for voucher in vouchers:
+        columns["party"].append(voucher.party)
+        columns["voucher_type"].append(voucher.voucher_type)
+        columns["voucher_no"].append(voucher.voucher_no)
+        columns["posting_date"].append(voucher.posting_date or voucher.due_date)
+        columns["due_date"].append(voucher.due_date)
+        columns["invoiced"].append(flt(voucher.invoiced))
+        columns["paid"].append(flt(voucher.paid))
+        columns["credit_note"].append(flt(voucher.credit_note))
+        columns["outstanding"].append(flt(voucher.outstanding))
+    return columns
+
+
+def count_outstanding_vouchers(company, report_date, customers=None) -> int:
+    """
+    The number of open vouchers of a set of customers as of the report date, for paging
+    """
+    return frappe.db.sql(f"SELECT COUNT(*) FROM ({get_outstanding_query(customers)}) vouchers",
+                         get_outstanding_params(company, report_date, customers))[0][0]
+
+
+def get_outstanding_params(company, report_date, customers=None) -> dict:
+    return {
+        "company": company,
+        "report_date": getdate(report_date),
+        "customers": tuple(customers or []),
+        "precision": 10 ** -(frappe.get_precision("Sales Invoice", "outstanding_amount") or 2)
+    }
+
+
+def get_outstanding_query(customers=None) -> str:
+    """
+    The Payment Ledger grouped per voucher into invoiced, paid and credit note amounts the way the
+    Accounts Receivable report splits them: positive entries are invoiced unless they are payments or
+    journals against another voucher (refunds), which reduce paid; negative entries are credit notes
+    when they are invoices against another voucher and payments otherwise.
+    Vouchers with nothing outstanding are left out
+    """
+    customer_condition = "AND ple.party IN %(customers)s" if customers else ""
+    own_entry = "(ple.voucher_type = ple.against_voucher_type AND ple.voucher_no = ple.against_voucher_no)"
+    payment_against = "(ple.voucher_type IN ('Journal Entry', 'Payment Entry') AND ple.voucher_no != ple.against_voucher_no)"
+    invoice_against = "(ple.voucher_type IN ('Sales Invoice', 'Purchase Invoice') AND ple.voucher_no != ple.against_voucher_no)"
+    return f"""
+                SELECT
+                    ple.party, ple.against_voucher_type AS voucher_type, ple.against_voucher_no AS voucher_no,
+                    MAX(CASE WHEN {own_entry} THEN ple.posting_date END) AS posting_date,
+                    MAX(CASE WHEN {own_entry} THEN ple.due_date END) AS due_date,
+                    SUM(CASE WHEN ple.amount > 0 AND NOT {payment_against} THEN ple.amount ELSE 0 END) AS invoiced,
+                    SUM(CASE WHEN (ple.amount > 0 AND {payment_against}) OR (ple.amount <= 0 AND NOT {invoice_against})
+                        THEN -ple.amount ELSE 0 END) AS paid,
+                    SUM(CASE WHEN ple.amount <= 0 AND {invoice_against} THEN -ple.amount ELSE 0 END) AS credit_note,
+                    SUM(ple.amount) AS outstanding
+                FROM `tabPayment Ledger Entry` ple
+                WHERE ple.company = %(company)s
+                AND ple.party_type = 'Customer'
+                AND ple.delinked = 0
+                AND ple.posting_date <= %(report_date)s
+                {customer_condition}
+                GROUP BY ple.party, ple.against_voucher_type, ple.against_voucher_no
+                HAVING ABS(SUM(ple.amount)) > %(precision)s
+    """
+
+
+def get_ageing_buckets(columns, report_date, ranges=DEFAULT_AGEING_RANGES) -> list:
+    """
+    The ageing bucket of every voucher in one pass over the columns: the index of the first range
+    the age (days past the due date, or the posting date) falls within, len(ranges) past the last one
+    """
+    report_date = getdate(report_date)
+    return [
+        bisect_left(ranges, (report_date - getdate(due_date or posting_date)).days) if (due_date or posting_date) else 0
+        for due_date, posting_date in zip(columns["due_date"], columns["posting_date"])
+    ]
+
+
+def get_customer_ageing(company, report_date=None, ranges=DEFAULT_AGEING_RANGES, customers=None) -> dict:
+    """
+    Age the outstanding of a set of customers, or all of them, into any ranges as of any date.
+    Returns per customer the invoiced, paid, credit note and outstanding totals and the range amounts
+    """
+    report_date = getdate(report_date)
+    columns = get_outstanding_vouchers(company, report_date, customers)
+    buckets = get_ageing_buckets(columns, report_date, ranges)
+
+    ageing = {}
+    for party, bucket, invoiced, paid, credit_note, outstanding in zip(columns["party"], buckets, columns["invoiced"],
+                                                                       columns["paid"], columns["credit_note"],
+                                                                       columns["outstanding"]):
+        totals = ageing.get(party)
+        if not totals:
+            totals = ageing[party] = [0, 0, 0, 0] + [0] * (len(ranges) + 1)
+        totals[0] += invoiced
+        totals[1] += paid
+        totals[2] += credit_note
+        totals[3] += outstanding
+        totals[4 + bucket] += outstanding
+
+    result = {}
+    for party, totals in ageing.items():
+        row = frappe._dict({"invoiced_amount": totals[0], "paid_amount": totals[1], "credit_note": totals[2],
+                            "outstanding": totals[3], "total_due": totals[3]})
+        for index in range(len(ranges) + 1):
+            row[f"range{index + 1}"] = totals[4 + index]
+        result[party] = row
+    return result
+
+
+@frappe.whitelist()
+def get_company_ageing(company, report_date=None, ranges=None, customers=None):
+    """
+    Company-wide receivables ageing: one row per customer with the outstanding aged into the ranges
+    ("30, 60, 90, 120" by default) as of the report date (today by default).
+    Shown by the Customer Receivables Ageing report, needs Accounts access to the Payment Ledger and the company
+    """
+    frappe.has_permission("Payment Ledger Entry", "read", throw=True)
+    frappe.has_permission("Company", "read", doc=company, throw=True)
+
+    if isinstance(customers, str):
+        customers = frappe.parse_json(customers)
+    ranges = parse_ageing_ranges(ranges)
+
+    ageing = get_customer_ageing(company, report_date, ranges, customers)
+    names = dict(frappe.get_all("Customer",
+                                filters={"name": ["in", list(ageing)]},
+                                fields=["name", "customer_name"],
+                                as_list=True)) if ageing else {}
+
+    rows = []
+    for customer in sorted(ageing):
+        rows.append({"customer": customer, "customer_name": names.get(customer), **ageing[customer]})
+    return {"ranges": ranges, "customers": rows}
+
+
+def parse_ageing_ranges(ranges=None) -> tuple:
+    """
+    Parse "30, 60, 90, 120" into increasing upper bounds of the ageing ranges
+    """
+    if not ranges:
+        return DEFAULT_AGEING_RANGES
+    if isinstance(ranges, str):
+        ranges = [value for value in ranges.replace(" ", "").split(",") if value]
+
+    ranges = tuple(cint(value) for value in ranges)
+    if any(value <= 0 for value in ranges) or list(ranges) != sorted(set(ranges)):
+        frappe.throw(_("Ageing ranges must be increasing positive numbers of days, e.g. 30, 60, 90, 120"))
+    return ranges
+
+
+def get_receivables_summary(customer_name, open_invoices, ranges=DEFAULT_AGEING_RANGES):
+    """
+    Summarise the customer's open vouchers the way the Accounts Receivable Summary report does
+    """
+    summary = frappe._dict({
+        "party_name": customer_name,
+        "invoiced_amount": 0,
+        "paid_amount": 0,
+        "credit_note": 0,
+        "outstanding": 0,
+        "total_due": 0
+    })
+    for index in range(len(ranges) + 1):
+        summary[f"range{index + 1}"] = 0
+
+    for row in open_invoices:
+        summary.invoiced_amount += row.invoiced
+        summary.paid_amount += row.paid
+        summary.credit_note += row.credit_note
+        summary.outstanding += row.outstanding
+        for index in range(len(ranges) + 1):
+            summary[f"range{index + 1}"] += row.get(f"range{index + 1}", 0)
+
+    summary.total_due = summary.outstanding
+    return summary
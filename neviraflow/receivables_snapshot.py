@@ -0,0 +1,73 @@
+import frappe
+from frappe.utils import getdate, flt
+
+
+SNAPSHOT_CACHE_PREFIX = "neviraflow_receivables_snapshot"
+SNAPSHOT_CACHE_TTL = 24 * 60 * 60
+SNAPSHOT_TABLES = ("all_transactions", "unpaid_invoices", "ageing_summary")
+
+
+def get_receivables_snapshot(company, customer, from_date, to_date, report_date, ranges=None):
+    """
+    Get the cached statement tables for (company, customer, from_date, to_date, report_date)
+    if nothing was posted for the customer since they were built, else None
+    """
+    snapshot = frappe.cache().hget(get_snapshot_key(customer),
+                                   get_snapshot_field(company, from_date, to_date, report_date, ranges))
+    if not snapshot or snapshot.get("fingerprint") != get_party_fingerprint(company, customer):
+        return None
+    return snapshot["tables"]
+
+
+def set_receivables_snapshot(company, customer, from_date, to_date, report_date, doc, ranges=None):
+    """
+    Cache the statement tables of the document with the customer's current ledger fingerprint
+    """
+    key = get_snapshot_key(customer)
+    frappe.cache().hset(key, get_snapshot_field(company, from_date, to_date, report_date, ranges), {
+        "fingerprint": get_party_fingerprint(company, customer),
+        "tables": {
+            table: [row.as_dict(no_default_fields=True) for row in doc.get(table)]
+            for table in SNAPSHOT_TABLES
+        }
+    })
+    frappe.cache().expire(frappe.cache().make_key(key), SNAPSHOT_CACHE_TTL)
+
+
+def get_party_fingerprint(company, customer):
+    """
+    The customer's ledger state from the maintained party balance and the Payment Ledger: every GL Entry
+    posted for the party updates its debit, credit and modified time, and reconciling or unreconciling
+    payments, which rewrites only Payment Ledger Entries, changes their latest modified time or count
+    """
+    row = frappe.db.get_value("Party Balance",
+                              {"company": company, "party_type": "Customer", "party": customer},
+                              ["modified", "debit", "credit"], as_dict=True)
+    if not row:
+        return None
+
+    payment_ledger = frappe.db.sql("""
+                SELECT MAX(modified), COUNT(name)
+                FROM `tabPayment Ledger Entry`
+                WHERE company = %s
+                AND party_type = 'Customer'
+                AND party = %s
+                """, (company, customer))[0]
+    return f"{row.modified}|{flt(row.debit, 2)}|{flt(row.credit, 2)}|{payment_ledger[0]}|{payment_ledger[1]}"
+
+
+def invalidate_receivables_snapshots(doc, method=None):
+    """
+    GL Entry and Payment Ledger Entry hook: drop the snapshots of the customer the entry was posted for
+    """
+    if doc.party_type == "Customer" and doc.party:
+        frappe.cache().delete_value(get_snapshot_key(doc.party))
+
+
+def get_snapshot_key(customer) -> str:
+    return f"{SNAPSHOT_CACHE_PREFIX}::{customer}"
+
+
+def get_snapshot_field(company, from_date, to_date, report_date, ranges=None) -> str:
+    field = f"{company}::{getdate(from_date)}::{getdate(to_date)}::{getdate(report_date)}"
+    return f"{field}::{','.join(str(value) for value in ranges)}" if ranges else field
@@ -0,0 +1,129 @@
+from bisect import bisect_right
+from datetime import date, datetime
+
+import frappe
+from frappe.utils import getdate
+
+
+SHIFT_INDEX_VERSION_KEY = "neviraflow_shift_assignment_index_version"
+
+## Per-site in-process index, rebuilt lazily when the version in redis moves on
+_shift_index = {}
+
+
+def get_shift_at(employee: str, when, default: str | None = None) -> str | None:
+    """
+    Get the shift type that applies to the employee at the given date/datetime.
+    Where assignments overlap, the most recently created one wins.
+    The lookup is a bisect over the employee's precomputed intervals, no SQL is run.
+    """
+    if not employee or not when:
+        return default
+
+    the_day = when.date() if isinstance(when, datetime) else getdate(when)
+    intervals = get_shift_index().get(employee)
+    if not intervals:
+        return default
+
+    starts, segments = intervals
+    pos = bisect_right(starts, the_day) - 1
+    if pos < 0:
+        return default
+
+    _start, end, shift_type = segments[pos]
+    if the_day > end:
+        return default
+    return shift_type
+
+
+def get_employees_with_shift_assignments() -> list[str]:
+    """
+    Get the employees that have at least one active shift assignment
+    """
+    return list(get_shift_index())
+
+
+def get_shift_index() -> dict:
+    """
+    Return the shift assignment index of the current site, rebuilding it if another
+    process has invalidated it since it was built
+    """
+    site = getattr(frappe.local, "site", None)
+    version = frappe.cache().get_value(SHIFT_INDEX_VERSION_KEY)
+    if version is None:
+        version = frappe.generate_hash(length=10)
+        frappe.cache().set_value(SHIFT_INDEX_VERSION_KEY, version)
+
+    cached = _shift_index.get(site)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    index = build_shift_index()
+    _shift_index[site] = (version, index)
+    return index
+
+
+def build_shift_index() -> dict:
+    """
+    Load every active Shift Assignment in one query and flatten each employee's assignments
+    into sorted, non-overlapping (start, end, shift_type) segments
+    """
+    assignments = frappe.db.sql("""
+                SELECT employee, shift_type, start_date, end_date, creation
+                FROM `tabShift Assignment`
+                WHERE status = 'Active' AND docstatus = 1
+                ORDER BY employee, creation
+                """, as_dict=True)
+
+    by_employee = {}
+    for row in assignments:
+        by_employee.setdefault(row.employee, []).append((
+            getdate(row.start_date) if row.start_date else date.min,
+            getdate(row.end_date) if row.end_date else date.max,
+            row.shift_type,
+        ))
+
+    index = {}
+    for employee, rows in by_employee.items():
+        segments = flatten_assignments(rows)
+        if segments:
+            index[employee] = ([seg[0] for seg in segments], segments)
+    return index
+
+
+def flatten_assignments(rows: list[tuple]) -> list[tuple]:
+    """
+    Split overlapping assignments (ordered oldest to newest) into segments where the
+    newest assignment covering each segment decides the shift
+    """
+    boundaries = set()
+    for start, end, _shift in rows:
+        boundaries.add(start)
+        if end != date.max:
+            boundaries.add(date.fromordinal(end.toordinal() + 1))
+    boundaries = sorted(boundaries)
+
+    segments = []
+    for i, seg_start in enumerate(boundaries):
+        seg_end = date.fromordinal(boundaries[i + 1].toordinal() - 1) if i + 1 < len(boundaries) else date.max
+
+        shift_type = None
+        for start, end, shift in rows:
+            if start <= seg_start and end >= seg_end:
+                shift_type = shift
+        if not shift_type:
+            continue
+
+        ## Merge with the previous segment when it is contiguous and the shift is the same
+        if segments and segments[-1][2] == shift_type and segments[-1][1].toordinal() + 1 == seg_start.toordinal():
+            segments[-1] = (segments[-1][0], seg_end, shift_type)
+        else:
+            segments.append((seg_start, seg_end, shift_type))
+    return segments
+
+
+def invalidate_shift_index(doc=None, method=None):
+    """
+    Shift Assignment hook: bump the index version so every process rebuilds on its next lookup
+    """
+    frappe.cache().set_value(SHIFT_INDEX_VERSION_KEY, frappe.generate_hash(length=10))
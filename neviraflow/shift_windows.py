@@ -0,0 +1,161 @@
+from datetime import datetime, time, timedelta
+from typing import NamedTuple
+
+import frappe
+
+
+SHIFT_WINDOW_VERSION_KEY = "neviraflow_shift_window_version"
+MINUTES_IN_DAY = 24 * 60
+
+## Used when a punch has no resolvable Shift Type: OUT punches before 10:00 belong to the previous day
+FALLBACK_OUT_CUTOFF = 10 * 60
+
+## Per-site in-process cache of the precomputed windows, rebuilt when the version in redis moves on
+_shift_windows = {}
+
+
+class ShiftWindow(NamedTuple):
+    """
+    Punch windows of a Shift Type in minutes of the day.
+    out_cutoff: OUT punches at or before this minute belong to the previous day's attendance
+    in_cutoff: IN punches before this minute belong to the previous day's attendance
+    in_next_day_from: IN punches from this minute belong to the next day's attendance
+    late_grace / early_grace: minutes allowed before an IN counts as late or an OUT as an early exit
+    half_day_hours / absent_hours: worked hours below which the attendance is a Half Day / Absent, 0 when not set
+    """
+    start: int
+    end: int
+    crosses_midnight: bool
+    out_cutoff: int | None
+    in_cutoff: int | None
+    in_next_day_from: int | None
+    late_grace: int = 0
+    early_grace: int = 0
+    half_day_hours: float = 0
+    absent_hours: float = 0
+
+
+def get_attendance_date(ts: datetime, log_type: str, shift_type: str | None = None):
+    """
+    Get the attendance date a punch belongs to using the precomputed window of its shift.
+    This is a couple of integer comparisons per punch, the windows are built once per Shift Type
+    """
+    minute = ts.hour * 60 + ts.minute
+    window = get_shift_window(shift_type)
+
+    if not window:
+        if log_type == "OUT" and 0 < minute < FALLBACK_OUT_CUTOFF:
+            return ts.date() - timedelta(days=1)
+        return ts.date()
+
+    if log_type == "OUT":
+        if window.out_cutoff is not None and minute <= window.out_cutoff:
+            return ts.date() - timedelta(days=1)
+
+    elif log_type == "IN":
+        if window.in_cutoff is not None and minute < window.in_cutoff:
+            return ts.date() - timedelta(days=1)
+        if window.in_next_day_from is not None and minute >= window.in_next_day_from:
+            return ts.date() + timedelta(days=1)
+
+    return ts.date()
+
+
+def get_shift_window(shift_type: str | None) -> ShiftWindow | None:
+    if not shift_type:
+        return None
+    return get_shift_windows().get(shift_type)
+
+
+def get_shift_windows() -> dict:
+    """
+    Return the windows of every Shift Type on the current site, rebuilding them if another
+    process has invalidated them since they were built
+    """
+    site = getattr(frappe.local, "site", None)
+    version = frappe.cache().get_value(SHIFT_WINDOW_VERSION_KEY)
+    if version is None:
+        version = frappe.generate_hash(length=10)
+        frappe.cache().set_value(SHIFT_WINDOW_VERSION_KEY, version)
+
+    cached = _shift_windows.get(site)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    windows = build_shift_windows()
+    _shift_windows[site] = (version, windows)
+    return windows
+
+
+def build_shift_windows() -> dict:
+    """
+    Load every Shift Type in one query and precompute its punch windows
+    """
+    shift_types = frappe.get_all("Shift Type",
+                                 fields=["name", "start_time", "end_time",
+                                         "begin_check_in_before_shift_start_time",
+                                         "allow_check_out_after_shift_end_time",
+                                         "enable_late_entry_marking", "late_entry_grace_period",
+                                         "enable_early_exit_marking", "early_exit_grace_period",
+                                         "working_hours_threshold_for_half_day", "working_hours_threshold_for_absent"])
+
+    windows = {}
+    for row in shift_types:
+        if row.start_time is None or row.end_time is None:
+            continue
+        windows[row.name] = make_shift_window(
+            to_minutes(row.start_time),
+            to_minutes(row.end_time),
+            row.begin_check_in_before_shift_start_time or 0,
+            row.allow_check_out_after_shift_end_time or 0,
+            (row.late_entry_grace_period or 0) if row.enable_late_entry_marking else 0,
+            (row.early_exit_grace_period or 0) if row.enable_early_exit_marking else 0,
+            row.working_hours_threshold_for_half_day or 0,
+            row.working_hours_threshold_for_absent or 0,
+        )
+    return windows
+
+
+def make_shift_window(start: int, end: int, check_in_before: int = 0, check_out_after: int = 0,
+                      late_grace: int = 0, early_grace: int = 0,
+                      half_day_hours: float = 0, absent_hours: float = 0) -> ShiftWindow:
+    """
+    Work out which punches of a shift roll over to another attendance date.
+    A shift crossing midnight (e.g SHIFT C 23:00 - 09:00) keeps its morning punches on the day the shift started.
+    A shift whose check-out grace runs past midnight keeps those early OUT punches on the previous day, and a shift
+    whose check-in window opens before midnight moves those late IN punches to the next day.
+    """
+    crosses_midnight = end <= start
+    out_cutoff, in_cutoff, in_next_day_from = None, None, None
+
+    if crosses_midnight:
+        ## Stop short of the next shift's start so an OUT can never swallow a new day
+        out_cutoff = min(end + check_out_after, start - 1)
+        in_cutoff = end
+    else:
+        if end + check_out_after >= MINUTES_IN_DAY:
+            out_cutoff = end + check_out_after - MINUTES_IN_DAY
+        if start - check_in_before < 0:
+            in_next_day_from = MINUTES_IN_DAY + start - check_in_before
+
+    return ShiftWindow(start, end, crosses_midnight, out_cutoff, in_cutoff, in_next_day_from, late_grace, early_grace,
+                       half_day_hours, absent_hours)
+
+
+def to_minutes(value) -> int:
+    """
+    Convert a Time field value (timedelta from the database, time or HH:MM:SS string) to minutes of the day
+    """
+    if isinstance(value, timedelta):
+        return int(value.total_seconds() // 60) % MINUTES_IN_DAY
+    if isinstance(value, time):
+        return value.hour * 60 + value.minute
+    hours, minutes = str(value).split(":")[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def invalidate_shift_windows(doc=None, method=None):
+    """
+    Shift Type hook: bump the version so every process rebuilds the windows on its next lookup
+    """
+    frappe.cache().set_value(SHIFT_WINDOW_VERSION_KEY, frappe.generate_hash(length=10))